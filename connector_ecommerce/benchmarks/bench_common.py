@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+# © 2016 Camptocamp SA
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html)
+""" Helpers shared by the benchmark scripts
+
+The scripts are run outside of the Odoo server, on a database where
+``connector_ecommerce`` is installed. They never commit anything.
+"""
+
+import resource
+import time
+from contextlib import contextmanager
+
+import mock
+
+import openerp
+from openerp import api, SUPERUSER_ID
+
+
+def load_config(config, database):
+    """ Load the Odoo configuration file, needed before importing the
+    addons """
+    openerp.tools.config.parse_config(['-c', config, '-d', database])
+
+
+@contextmanager
+def environment(database):
+    """ Yield an environment on a cursor which is rolled back """
+    registry = openerp.modules.registry.RegistryManager.get(database)
+    with api.Environment.manage():
+        cr = registry.cursor()
+        try:
+            yield api.Environment(cr, SUPERUSER_ID, {})
+        finally:
+            cr.rollback()
+            cr.close()
+
+
+def connector_environment(env, model_name):
+    """ Return a ``ConnectorEnvironment`` with a fake backend """
+    from openerp.addons.connector.session import ConnectorSession
+    from openerp.addons.connector.connector import ConnectorEnvironment
+    session = ConnectorSession.from_env(env)
+    return ConnectorEnvironment(mock.Mock(), session, model_name)
+
+
+def _max_rss_kb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+class Measure(object):
+    """ Measure the time, SQL queries and memory growth of a block
+
+    Usage::
+
+        with Measure(env.cr) as measure:
+            ...
+        measure.seconds, measure.queries, measure.peak_memory_growth_kb
+
+    The memory growth is an approximation: it is the increase of the
+    maximum resident set size of the process during the block. The
+    maximum is kept for the life of the process, so the memory used by
+    the block under the peak reached before it is not counted (it is 0
+    when the block uses less memory than a previous one).
+    """
+
+    def __init__(self, cr):
+        self.cr = cr
+        self.seconds = None
+        self.queries = None
+        self.peak_memory_growth_kb = None
+
+    def __enter__(self):
+        self._queries = self.cr.sql_log_count
+        self._max_rss_kb = _max_rss_kb()
+        self._start = time.time()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.seconds = time.time() - self._start
+        self.queries = self.cr.sql_log_count - self._queries
+        self.peak_memory_growth_kb = _max_rss_kb() - self._max_rss_kb
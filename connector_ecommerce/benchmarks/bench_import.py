@@ -0,0 +1,205 @@
+# -*- coding: utf-8 -*-
+# © 2016 Camptocamp SA
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html)
+""" Benchmark of the import of sales orders (onchanges and line builders)
+
+Synthetic sales orders with 1, 10, 100 and 500 lines, with mixed
+products and partners, are driven through the special line builders
+(shipping, cash on delivery, gift) and ``SaleOrderOnChange``.
+
+For each size of order, it reports the number of lines per second, the
+number of SQL queries and the growth of the peak memory (an
+approximation, see ``Measure``). The results are written in a JSON file
+which can be compared between releases.
+
+Usage::
+
+    python bench_import.py -c /etc/odoo.cfg -d database \\
+        [--output result.json] [--sizes 1,10,100,500] [--play-many]
+
+The database must have ``connector_ecommerce`` installed. The partners
+and products are created in a transaction which is rolled back at the
+end, no network access is needed.
+"""
+
+from __future__ import print_function
+
+import argparse
+import datetime
+import json
+import random
+
+import openerp
+
+from bench_common import (load_config, environment, connector_environment,
+                          Measure)
+
+SIZES = (1, 10, 100, 500)
+
+
+def create_records(env, partners_count, products_count):
+    partner_model = env['res.partner']
+    partners = partner_model.browse()
+    for index in range(partners_count):
+        partners |= partner_model.create({
+            'name': 'Benchmark Customer %d' % index,
+            'zip': '%05d' % index,
+            'city': 'Lausanne',
+        })
+    tax_model = env['account.tax']
+    taxes = [tax_model.create({'name': 'Benchmark Tax %d' % rate,
+                               'amount': rate,
+                               'type_tax_use': 'sale'})
+             for rate in (2.5, 8.0, 20.0)]
+    product_model = env['product.product']
+    products = product_model.browse()
+    for index in range(products_count):
+        products |= product_model.create({
+            'name': 'Benchmark Product %d' % index,
+            'default_code': 'BENCH-%d' % index,
+            'list_price': 10 + index,
+            'taxes_id': [(6, 0, [taxes[index % len(taxes)].id])],
+        })
+    return partners, products
+
+
+def generate_orders(rand, partners, products, lines_per_order, count):
+    orders = []
+    for index in range(count):
+        lines = [(0, 0, {'product_id': rand.choice(products).id,
+                         'price_unit': rand.randint(1, 500),
+                         'product_uom_qty': rand.randint(1, 5),
+                         'name': 'Line %d' % line_index,
+                         })
+                 for line_index in range(lines_per_order)]
+        orders.append({'name': 'BENCH-%d-%d' % (lines_per_order, index),
+                       'partner_id': rand.choice(partners).id,
+                       'backend_order_line': lines,
+                       'shipping_amount': rand.randint(0, 20),
+                       'cod_fee': rand.choice([0, 0, 5]),
+                       'gift_amount': rand.choice([0, 0, 0, 10]),
+                       })
+    return orders
+
+
+def build_special_lines(builders, order):
+    """ Add the special lines to the order the way the connectors do """
+    shipping, cash_on_delivery, gift = builders
+    lines = []
+    shipping.price_unit = order.pop('shipping_amount')
+    lines.append((0, 0, shipping.get_line()))
+    cod_fee = order.pop('cod_fee')
+    if cod_fee:
+        cash_on_delivery.price_unit = cod_fee
+        lines.append((0, 0, cash_on_delivery.get_line()))
+    gift_amount = order.pop('gift_amount')
+    if gift_amount:
+        gift.price_unit = gift_amount
+        gift.gift_code = 'BENCH'
+        lines.append((0, 0, gift.get_line()))
+    order['order_line'] = lines
+
+
+def run_case(env, args, partners, products, lines_per_order):
+    from openerp.addons.connector_ecommerce.unit.sale_order_onchange import (
+        SaleOrderOnChange)
+    from openerp.addons.connector_ecommerce.unit.line_builder import (
+        ShippingLineBuilder, CashOnDeliveryLineBuilder, GiftOrderLineBuilder)
+
+    rand = random.Random(args.seed + lines_per_order)
+    count = max(1, args.lines // lines_per_order)
+    orders = generate_orders(rand, partners, products,
+                             lines_per_order, count)
+    lines_count = sum(len(order['backend_order_line']) for order in orders)
+
+    line_env = connector_environment(env, 'sale.order.line')
+    order_env = connector_environment(env, 'sale.order')
+    # start every case with an empty cache of records
+    env.invalidate_all()
+    with Measure(env.cr) as measure:
+        builders = (ShippingLineBuilder(line_env),
+                    CashOnDeliveryLineBuilder(line_env),
+                    GiftOrderLineBuilder(line_env))
+        for order in orders:
+            build_special_lines(builders, order)
+        onchange = SaleOrderOnChange(order_env)
+        onchange.sparse_onchange = args.sparse
+        onchange.line_onchange_cache_size = args.line_cache
+        batch = [(order, order['backend_order_line']) for order in orders]
+        if args.play_many:
+            onchange.play_many(batch)
+        else:
+            for order, order_lines in batch:
+                onchange.play(order, order_lines)
+
+    return {'lines_per_order': lines_per_order,
+            'orders': count,
+            'lines': lines_count,
+            'seconds': measure.seconds,
+            'lines_per_second': lines_count / measure.seconds,
+            'queries': measure.queries,
+            'queries_per_line': float(measure.queries) / lines_count,
+            'peak_memory_growth_kb': measure.peak_memory_growth_kb,
+            }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('-c', '--config', required=True)
+    parser.add_argument('-d', '--database', required=True)
+    parser.add_argument('--output', default='bench_import.json',
+                        help="JSON file receiving the results")
+    parser.add_argument('--sizes', default=','.join(map(str, SIZES)),
+                        help="Comma separated numbers of lines per order")
+    parser.add_argument('--lines', type=int, default=1000,
+                        help="Approximate number of lines per size")
+    parser.add_argument('--partners', type=int, default=20)
+    parser.add_argument('--products', type=int, default=50)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--play-many', action='store_true',
+                        help="Use SaleOrderOnChange.play_many()")
+    parser.add_argument('--sparse', action='store_true',
+                        help="Use the sparse onchange mode")
+    parser.add_argument('--line-cache', type=int, default=0,
+                        help="Size of the cache of line onchanges")
+    args = parser.parse_args()
+    sizes = [int(size) for size in args.sizes.split(',')]
+
+    load_config(args.config, args.database)
+
+    with environment(args.database) as env:
+        partners, products = create_records(env, args.partners,
+                                            args.products)
+        module = env['ir.module.module'].search(
+            [('name', '=', 'connector_ecommerce')]
+        )
+        module_version = module.latest_version
+        cases = []
+        for size in sizes:
+            case = run_case(env, args, partners, products, size)
+            print('%(lines_per_order)4d lines/order: '
+                  '%(lines_per_second)9.1f lines/s '
+                  '%(queries_per_line)7.2f queries/line '
+                  '%(peak_memory_growth_kb)8d KB peak growth' % case)
+            cases.append(case)
+
+    result = {'date': datetime.datetime.utcnow().isoformat(),
+              'odoo_version': openerp.release.version,
+              'module_version': module_version,
+              'options': {'play_many': args.play_many,
+                          'sparse': args.sparse,
+                          'line_cache': args.line_cache,
+                          'lines': args.lines,
+                          'partners': args.partners,
+                          'products': args.products,
+                          'seed': args.seed,
+                          },
+              'cases': cases,
+              }
+    with open(args.output, 'w') as output:
+        json.dump(result, output, indent=2, sort_keys=True)
+    print('results written in %s' % args.output)
+
+
+if __name__ == '__main__':
+    main()
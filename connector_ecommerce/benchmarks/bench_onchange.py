@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+# © 2016 Camptocamp SA
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html)
+""" Measure the cost per line of ``OnChangeManager.play_onchanges``
+
+The onchanges of sales order lines are played with and without the
+registry-level cache of the onchange specs and blank values.
+
+Usage::
+
+    python bench_onchange.py -c /etc/odoo.cfg -d database [--lines 500]
+
+The database must have ``connector_ecommerce`` installed. The benchmark
+works in a transaction which is rolled back at the end.
+"""
+
+from __future__ import print_function
+
+import argparse
+import time
+
+from bench_common import load_config, environment, connector_environment
+
+
+def line_values(env, count):
+    products = env['product.product'].search([('sale_ok', '=', True)],
+                                             limit=20)
+    assert products, "no product to sell in the database"
+    return [{'product_id': products[index % len(products)].id,
+             'price_unit': 10.0,
+             'product_uom_qty': 1 + index % 3,
+             'name': 'Line %d' % index,
+             } for index in range(count)]
+
+
+def bench(onchange, lines):
+    # warm up the caches (ORM and onchange template)
+    onchange.play_onchanges('sale.order.line', dict(lines[0]),
+                            onchange.line_onchange_fields)
+    start = time.time()
+    for values in lines:
+        onchange.play_onchanges('sale.order.line', dict(values),
+                                onchange.line_onchange_fields)
+    return (time.time() - start) / len(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('-c', '--config', required=True)
+    parser.add_argument('-d', '--database', required=True)
+    parser.add_argument('--lines', type=int, default=500)
+    args = parser.parse_args()
+
+    load_config(args.config, args.database)
+    from openerp.addons.connector_ecommerce.unit.sale_order_onchange import (
+        SaleOrderOnChange)
+
+    with environment(args.database) as env:
+        connector_env = connector_environment(env, 'sale.order')
+        lines = line_values(env, args.lines)
+        results = {}
+        for use_cache in (False, True):
+            onchange = SaleOrderOnChange(connector_env)
+            onchange.use_onchange_cache = use_cache
+            results[use_cache] = bench(onchange, lines)
+
+    print('lines: %d' % args.lines)
+    print('without cache: %.3f ms per line' % (results[False] * 1000))
+    print('with cache:    %.3f ms per line' % (results[True] * 1000))
+
+
+if __name__ == '__main__':
+    main()
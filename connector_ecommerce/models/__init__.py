@@ -1,8 +1,14 @@
 # -*- coding: utf-8 -*-
 from . import account
+from . import ir_config_parameter
 from . import event
+from . import event_outbox
+from . import event_stats
+from . import change_feed
+from . import binding
 from . import invoice
 from . import account_payment_mode
 from . import product
+from . import product_price
 from . import sale
 from . import stock
@@ -2,30 +2,128 @@
 # © 2011-2013 Akretion (Sébastien Beau)
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html)
 
-from openerp import models
+import bisect
+
+from openerp import models, api, tools
+
+
+def _find_rate(rates, tax_ids, rate, precision):
+    """ Return the id of the tax having the nearest rate within the
+    precision, or None """
+    start = bisect.bisect_left(rates, rate - precision)
+    stop = bisect.bisect_right(rates, rate + precision)
+    if start == stop:
+        return None
+    nearest = min(xrange(start, stop),
+                  key=lambda position: abs(rates[position] - rate))
+    return tax_ids[nearest]
 
 
 class AccountTaxCode(models.Model):
     _inherit = 'account.tax'
 
-    def get_tax_from_rate(self, rate, is_tax_included=False):
-        account_tax_model = self.env['account.tax']
-        tax = account_tax_model.search(
-            [('price_include', '=', is_tax_included),
-             ('type_tax_use', 'in', ['sale', 'all']),
-             ('amount', '>=', rate - 0.001),
-             ('amount', '<=', rate + 0.001)],
-            limit=1,
+    @api.model
+    def _tax_rate_index_fields(self):
+        """ Fields used to build the index of ``get_tax_from_rate`` """
+        return {'amount', 'price_include', 'type_tax_use', 'company_id',
+                'active', 'sequence'}
+
+    @api.model
+    @tools.ormcache('company_id')
+    def _get_tax_rate_index(self, company_id):
+        """ Return the sale taxes of a company, indexed by rate
+
+        The index is kept in the registry's cache and is cleared when a
+        tax is created, modified or deleted.
+
+        :return: {price_include: (sorted rates, tax ids)}, when several
+                 taxes have the same rate, the first in the order of the
+                 taxes comes first
+        """
+        taxes = self.sudo().search(
+            [('type_tax_use', 'in', ['sale', 'all']),
+             ('company_id', '=', company_id)]
         )
-        if tax:
-            return tax
-
-        # try to find a tax with less precision
-        tax = account_tax_model.search(
-            [('price_include', '=', is_tax_included),
-             ('type_tax_use', 'in', ['sale', 'all']),
-             ('amount', '>=', rate - 0.01),
-             ('amount', '<=', rate + 0.01)],
-            limit=1,
+        entries = {True: [], False: []}
+        for position, tax in enumerate(taxes):
+            entries[tax.price_include].append((tax.amount, position, tax.id))
+        index = {}
+        for included, tax_entries in entries.iteritems():
+            tax_entries.sort()
+            index[included] = (tuple(entry[0] for entry in tax_entries),
+                               tuple(entry[2] for entry in tax_entries))
+        return index
+
+    @api.model
+    def _tax_group_index_fields(self):
+        """ Fields used to build the index of ``_get_tax_group_index`` """
+        return {'tax_group_id', 'type_tax_use', 'company_id', 'active',
+                'sequence'}
+
+    @api.model
+    @tools.ormcache('company_id')
+    def _get_tax_group_index(self, company_id):
+        """ Return the sale taxes of a company, indexed by tax group
+
+        The index is kept in the registry's cache and is cleared when a
+        tax is created, modified or deleted.
+
+        :return: {tax group id: tax ids in the order of the taxes}
+        """
+        taxes = self.sudo().search(
+            [('type_tax_use', 'in', ['sale', 'all']),
+             ('company_id', '=', company_id)]
         )
+        index = {}
+        for tax in taxes:
+            if tax.tax_group_id:
+                index.setdefault(tax.tax_group_id.id, []).append(tax.id)
+        return {group_id: tuple(tax_ids)
+                for group_id, tax_ids in index.iteritems()}
+
+    def get_taxes_from_rates(self, rates):
+        """ Find the sale taxes for many rates at once
+
+        Same as ``get_tax_from_rate`` for each rate, without any query
+        once the index of the taxes is loaded.
+
+        :param rates: list of tuples (rate, is_tax_included)
+        :return: list of taxes (empty recordset when no tax is found),
+                 in the same order than ``rates``
+        """
+        account_tax_model = self.env['account.tax']
+        company_id = self.env.user.company_id.id
+        index = account_tax_model._get_tax_rate_index(company_id)
+        taxes = []
+        for rate, is_tax_included in rates:
+            tax_rates, tax_ids = index[bool(is_tax_included)]
+            tax_id = _find_rate(tax_rates, tax_ids, rate, 0.001)
+            if tax_id is None:
+                # try to find a tax with less precision
+                tax_id = _find_rate(tax_rates, tax_ids, rate, 0.01)
+            taxes.append(account_tax_model.browse(tax_id or []))
+        return taxes
+
+    def get_tax_from_rate(self, rate, is_tax_included=False):
+        return self.get_taxes_from_rates([(rate, is_tax_included)])[0]
+
+    @api.model
+    def create(self, vals):
+        tax = super(AccountTaxCode, self).create(vals)
+        self.clear_caches()
         return tax
+
+    @api.multi
+    def write(self, vals):
+        result = super(AccountTaxCode, self).write(vals)
+        index_fields = (self._tax_rate_index_fields() |
+                        self._tax_group_index_fields())
+        if index_fields.intersection(vals):
+            self.clear_caches()
+        return result
+
+    @api.multi
+    def unlink(self):
+        result = super(AccountTaxCode, self).unlink()
+        self.clear_caches()
+        return result
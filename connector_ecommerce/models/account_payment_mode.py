@@ -2,7 +2,15 @@
 # © 2011-2013 Akretion (Sébastien Beau)
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html)
 
-from openerp import models, fields, api
+import psycopg2
+
+from openerp import models, fields, api, tools, _
+from openerp.addons.connector.exception import RetryableJobError
+
+
+def normalize_payment_method(name):
+    """ Key used to compare the names of the payment methods """
+    return name.strip().lower()
 
 
 class AccountPaymentMode(models.Model):
@@ -28,6 +36,39 @@ class AccountPaymentMode(models.Model):
                                    string="Import Rule",
                                    default='always',
                                    required=True)
+    # set on the payment modes created by get_or_create_payment_method
+    # so 2 concurrent imports cannot create the same payment mode, kept
+    # in sync with the name when the payment mode is renamed
+    normalized_name = fields.Char(readonly=True, copy=False)
+
+    _sql_constraints = [
+        ('normalized_name_uniq',
+         'unique(normalized_name, company_id)',
+         'A payment mode with the same name has already been created '
+         'by an import.'),
+    ]
+
+    @api.model
+    def _payment_method_cache_fields(self):
+        """ Fields used by the cache of ``get_or_create_payment_method`` """
+        return {'name', 'normalized_name', 'company_id', 'active'}
+
+    @api.model
+    @tools.ormcache('normalized_name', 'company_id')
+    def _get_payment_method_id(self, normalized_name, company_id):
+        """ Return the id of the payment mode having the name, or False
+
+        The result is kept in the registry's cache. The cache is cleared
+        when a payment mode is created, deleted or renamed.
+        """
+        method = self.sudo().search(
+            [('company_id', '=', company_id),
+             '|',
+             ('normalized_name', '=', normalized_name),
+             ('name', '=ilike', normalized_name)],
+            limit=1,
+        )
+        return method.id
 
     @api.model
     def get_or_create_payment_method(self, payment_method):
@@ -38,8 +79,86 @@ class AccountPaymentMode(models.Model):
         :return: required payment method
         :rtype: recordset
         """
-        domain = [('name', '=ilike', payment_method)]
-        method = self.search(domain, limit=1)
-        if not method:
-            method = self.create({'name': payment_method})
+        normalized_name = normalize_payment_method(payment_method)
+        company_id = self.env.user.company_id.id
+        method_id = self._get_payment_method_id(normalized_name, company_id)
+        if method_id:
+            return self.browse(method_id)
+        try:
+            with self.env.cr.savepoint():
+                method = self.create({'name': payment_method,
+                                      'normalized_name': normalized_name})
+        except psycopg2.IntegrityError:
+            # another transaction is creating the same payment mode,
+            # it will be visible when the job is retried
+            raise RetryableJobError(
+                _('The payment mode %s is being created by another '
+                  'transaction.') % payment_method
+            )
         return method
+
+    @api.model
+    def get_or_create_payment_methods(self, payment_methods):
+        """ Get or create many payment methods at once
+
+        The existing payment methods are searched with one query, the
+        missing ones are created with ``get_or_create_payment_method``.
+
+        :param payment_methods: names of the payment methods
+        :type payment_methods: list of str
+        :return: {name: payment method}
+        :rtype: dict
+        """
+        if not payment_methods:
+            return {}
+        company_id = self.env.user.company_id.id
+        names = {normalize_payment_method(name) for name in payment_methods}
+        domain = ['|'] * (len(names) - 1)
+        domain += [('name', '=ilike', name) for name in names]
+        domain = ['&', ('company_id', '=', company_id),
+                  '|', ('normalized_name', 'in', list(names))] + domain
+        found = {}
+        for method in self.search(domain):
+            if method.normalized_name in names:
+                found.setdefault(method.normalized_name, method)
+            found.setdefault(normalize_payment_method(method.name), method)
+
+        result = {}
+        for name in payment_methods:
+            method = found.get(normalize_payment_method(name))
+            if not method:
+                method = self.get_or_create_payment_method(name)
+            result[name] = method
+        return result
+
+    @api.model
+    def create(self, vals):
+        method = super(AccountPaymentMode, self).create(vals)
+        self.clear_caches()
+        return method
+
+    @api.multi
+    def write(self, vals):
+        imported = self.browse()
+        if vals.get('name') and 'normalized_name' not in vals:
+            # keep the key of the imported payment modes in sync with
+            # their name
+            imported = self.filtered('normalized_name')
+        others = self - imported
+        result = True
+        if imported:
+            imported_vals = dict(
+                vals, normalized_name=normalize_payment_method(vals['name'])
+            )
+            result = super(AccountPaymentMode, imported).write(imported_vals)
+        if others or not imported:
+            result = super(AccountPaymentMode, others).write(vals)
+        if self._payment_method_cache_fields().intersection(vals):
+            self.clear_caches()
+        return result
+
+    @api.multi
+    def unlink(self):
+        result = super(AccountPaymentMode, self).unlink()
+        self.clear_caches()
+        return result
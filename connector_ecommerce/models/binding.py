@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+# © 2016 Camptocamp SA
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html)
+
+import weakref
+from collections import defaultdict
+
+# {database name: (weak reference to the registry,
+#                  {model name: [(binding model name, inherits field)]})}
+# the registry is not hashable, the entry of a database is replaced
+# when its registry is reloaded
+_binding_models = {}
+
+
+def get_binding_models(env, model_name):
+    """ Return the binding models of a model
+
+    The binding models are the models which ``_inherits`` the model and
+    have a ``backend_id`` field, such as ``magento.product.product`` for
+    ``product.product``. They are searched once per registry.
+
+    :return: list of (binding model name, name of the field pointing to
+             the record of ``model_name``)
+    """
+    registry = env.registry
+    registry_ref, by_model = _binding_models.get(registry.db_name,
+                                                 (None, None))
+    if registry_ref is None or registry_ref() is not registry:
+        by_model = {}
+        _binding_models[registry.db_name] = (weakref.ref(registry),
+                                             by_model)
+    if model_name not in by_model:
+        bindings = []
+        for name in registry:
+            model = registry[name]
+            if model._abstract or not model._auto:
+                continue
+            field_name = model._inherits.get(model_name)
+            if field_name and 'backend_id' in model._fields:
+                bindings.append((name, field_name))
+        by_model[model_name] = sorted(bindings)
+    return by_model[model_name]
+
+
+def get_bound_backends(env, model_name, record_ids):
+    """ Return the backends having a binding on the records
+
+    The binding tables are read directly, with one query per binding
+    model for all the records, so the result is always up-to-date with
+    the bindings created or deleted, including in other transactions.
+
+    :return: {record id: set of (backend model, backend id)}, only the
+             records having at least one binding are in the result
+    """
+    backends = defaultdict(set)
+    if not record_ids:
+        return backends
+    for binding_name, field_name in get_binding_models(env, model_name):
+        binding_model = env[binding_name]
+        backend_model = binding_model._fields['backend_id'].comodel_name
+        env.cr.execute(
+            'SELECT DISTINCT "%s", backend_id FROM "%s" '
+            'WHERE "%s" IN %%s AND backend_id IS NOT NULL' %
+            (field_name, binding_model._table, field_name),
+            (tuple(record_ids),)
+        )
+        for record_id, backend_id in env.cr.fetchall():
+            backends[record_id].add((backend_model, backend_id))
+    return backends
+
+
+def skip_unbound_records(env):
+    """ Return True if the events are not fired for the records
+    without binding (system parameter
+    ``connector_ecommerce.skip_unbound_records``) """
+    params = env['ir.config_parameter'].sudo()
+    return params.get_param('connector_ecommerce.skip_unbound_records',
+                            default='False') in ('1', 'True', 'true')
+
+
+def filter_bound(records):
+    """ Return the records related to an e-commerce backend
+
+    The records are kept when they, or the records they come from, have
+    a binding (see ``_get_bound_backends`` on the models). When the
+    system parameter ``connector_ecommerce.skip_unbound_records`` is
+    not set, all the records are returned.
+    """
+    if not records or not skip_unbound_records(records.env):
+        return records
+    backends = records._get_bound_backends()
+    return records.filtered(lambda record: record.id in backends)
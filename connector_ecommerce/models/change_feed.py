@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+# © 2016 Camptocamp SA
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html)
+
+from datetime import datetime, timedelta
+
+from openerp import models, fields, api, exceptions, _
+
+
+class ConnectorChangeFeed(models.Model):
+    """ Changes of the records, read by the connectors by pages
+
+    When the change feed is activated (system parameter
+    ``connector_ecommerce.change_feed``), each event fired for a record
+    (invoice paid, picking done, tracking number added, price changed,
+    ...) adds a row to the feed in the transaction of the change.
+
+    The connectors read the changes after a cursor with
+    :meth:`read_changes`. The changes are sorted by transaction then
+    by id and only the changes of the transactions older than all the
+    running transactions are returned, so a change committed late can
+    never be placed before a cursor already returned.
+    """
+    _name = 'connector.change.feed'
+    _description = 'Connector Change Feed'
+    _order = 'id'
+
+    model_name = fields.Char(required=True, readonly=True)
+    res_id = fields.Integer(string='Record ID', required=True, readonly=True)
+    kind = fields.Char(required=True, readonly=True)
+
+    def init(self, cr):
+        # the transaction ids (bigint) are not a field, they are only
+        # used in SQL by the feed
+        cr.execute("SELECT 1 FROM information_schema.columns "
+                   "WHERE table_name = 'connector_change_feed' "
+                   "AND column_name = 'txid'")
+        if not cr.fetchone():
+            cr.execute("ALTER TABLE connector_change_feed "
+                       "ADD COLUMN txid bigint")
+        cr.execute("SELECT indexname FROM pg_indexes "
+                   "WHERE indexname = 'connector_change_feed_txid_id_index'")
+        if not cr.fetchone():
+            cr.execute("CREATE INDEX connector_change_feed_txid_id_index "
+                       "ON connector_change_feed (txid, id)")
+
+    @api.model
+    def _is_enabled(self):
+        return self.env['ir.config_parameter']._get_connector_flag(
+            'connector_ecommerce.change_feed'
+        )
+
+    @api.model
+    def _add_change(self, model_name, res_id, kind):
+        """ Add a change in the feed, with a single query """
+        self.env.cr.execute(
+            "INSERT INTO connector_change_feed "
+            "(model_name, res_id, kind, txid, create_uid, create_date, "
+            " write_uid, write_date) "
+            "VALUES (%s, %s, %s, txid_current(), %s, "
+            "        now() at time zone 'UTC', %s, "
+            "        now() at time zone 'UTC')",
+            (model_name, res_id, kind, self.env.uid, self.env.uid)
+        )
+
+    @api.model
+    def _get_visible_txid(self):
+        """ Return the oldest transaction still running, the changes of
+        this transaction and of the next ones are not visible yet """
+        self.env.cr.execute(
+            "SELECT txid_snapshot_xmin(txid_current_snapshot())"
+        )
+        return self.env.cr.fetchone()[0]
+
+    @staticmethod
+    def _parse_cursor(cursor):
+        if not cursor:
+            return 0, 0
+        try:
+            txid, change_id = cursor.split('-')
+            return int(txid), int(change_id)
+        except ValueError:
+            raise exceptions.UserError(_('Invalid cursor %s') % cursor)
+
+    @api.model
+    def read_changes(self, cursor=None, limit=1000, model_name=None,
+                     kinds=None):
+        """ Return the changes following a cursor
+
+        :param cursor: cursor returned by the previous call, None to
+                       read the feed from the beginning
+        :param limit: maximum number of changes returned
+        :param model_name: only return the changes of this model
+        :param kinds: only return the changes of these kinds
+        :return: dict with the keys:
+
+            * ``changes``: list of dicts with the keys ``model``,
+              ``id``, ``kind`` and ``sequence`` (the cursor of the
+              change)
+            * ``cursor``: the cursor to read the next changes, the same
+              than the given cursor when there are no changes
+        """
+        self.check_access_rights('read')
+        txid, change_id = self._parse_cursor(cursor)
+        query = ("SELECT id, model_name, res_id, kind, txid "
+                 "FROM connector_change_feed "
+                 "WHERE (txid, id) > (%s, %s) AND txid < %s ")
+        params = [txid, change_id, self._get_visible_txid()]
+        if model_name:
+            query += "AND model_name = %s "
+            params.append(model_name)
+        if kinds:
+            query += "AND kind IN %s "
+            params.append(tuple(kinds))
+        query += "ORDER BY txid, id LIMIT %s"
+        params.append(limit)
+        self.env.cr.execute(query, params)
+        changes = []
+        for row in self.env.cr.fetchall():
+            row_id, row_model, res_id, kind, row_txid = row
+            cursor = '%d-%d' % (row_txid, row_id)
+            changes.append({'model': row_model,
+                            'id': res_id,
+                            'kind': kind,
+                            'sequence': cursor,
+                            })
+        return {'changes': changes, 'cursor': cursor}
+
+    @api.model
+    def _cron_purge(self):
+        """ Remove the changes older than the retention period """
+        params = self.env['ir.config_parameter'].sudo()
+        days = int(params.get_param(
+            'connector_ecommerce.change_feed_retention_days', default=30
+        ))
+        limit = datetime.now() - timedelta(days=days)
+        self.env.cr.execute(
+            "DELETE FROM connector_change_feed WHERE create_date < %s",
+            (fields.Datetime.to_string(limit),)
+        )
+        return True
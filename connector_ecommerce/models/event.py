@@ -2,7 +2,19 @@
 # © 2013 Camptocamp SA
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html)
 
+import bisect
+import logging
+import threading
+import time
+import weakref
+from collections import OrderedDict
+
+import openerp
+from openerp import api
 from openerp.addons.connector.event import Event
+from openerp.addons.connector.session import ConnectorSession
+
+_logger = logging.getLogger(__name__)
 
 
 on_picking_out_done = Event()
@@ -19,6 +31,21 @@ Listeners should take the following arguments:
 """
 
 
+on_picking_out_done_batch = Event()
+"""
+``on_picking_out_done_batch`` is fired at the same time as
+``on_picking_out_done``, once for all the outgoing pickings done
+together instead of once per picking.
+
+Listeners should take the following arguments:
+
+ * session: `connector.session.ConnectorSession` object
+ * model_name: name of the model
+ * picking_types: list of (record_id, type) where type is 'partial' or
+   'complete' depending on the picking done
+"""
+
+
 on_tracking_number_added = Event()
 """
 ``on_tracking_number_added`` is fired when a picking has been marked as
@@ -54,6 +81,32 @@ Listeners should take the following arguments:
  * record_id: id of the record
 """
 
+on_invoice_paid_batch = Event()
+"""
+``on_invoice_paid_batch`` is fired at the same time as
+``on_invoice_paid``, once for all the invoices paid together instead of
+once per invoice.
+
+Listeners should take the following arguments:
+
+ * session: `connector.session.ConnectorSession` object
+ * model_name: name of the model
+ * record_ids: ids of the records
+"""
+
+on_invoice_validated_batch = Event()
+"""
+``on_invoice_validated_batch`` is fired at the same time as
+``on_invoice_validated``, once for all the invoices validated together
+instead of once per invoice.
+
+Listeners should take the following arguments:
+
+ * session: `connector.session.ConnectorSession` object
+ * model_name: name of the model
+ * record_ids: ids of the records
+"""
+
 on_product_price_changed = Event()
 """
 ``on_product_price_changed`` is fired when the price of a product is
@@ -68,3 +121,282 @@ because it depends on the pricelists.
  * record_id: id of the record
 
 """
+
+on_product_price_changed_batch = Event()
+"""
+``on_product_price_changed_batch`` is fired at the same time as
+``on_product_price_changed``, once for all the products of a write
+instead of once per product. Listeners which export the prices by
+batch should subscribe to this event instead of
+``on_product_price_changed``.
+
+Listeners should take the following arguments:
+
+ * session: `connector.session.ConnectorSession` object
+ * model_name: name of the model
+ * record_ids: ids of the records
+"""
+
+
+# {name: event} of the events which can be stored in the outbox
+outbox_events = {}
+
+
+def register_outbox_event(name, event):
+    """ Allow an event to be stored in the outbox
+
+    The outbox stores the name of the events, the name given here is
+    used to find the event back when the outbox is dispatched. The
+    events of this module are registered with their variable name.
+    """
+    outbox_events[name] = event
+
+
+def _get_event_name(event):
+    for name, outbox_event in outbox_events.iteritems():
+        if outbox_event is event:
+            return name
+    return None
+
+
+class EventStats(object):
+    """ Counters and timings of the events dispatched by this process
+
+    For each event, count the number of times it has been fired and the
+    number of listeners called. For each event and for each listener,
+    keep the total and maximal duration and a histogram of the
+    durations. The statistics are kept in memory, they are per process
+    and reset when the process is restarted.
+    """
+
+    # upper bounds of the buckets of the histograms, in seconds, the
+    # last bucket counts the durations above the last bound
+    buckets = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5)
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.events = {}
+        self.listeners = {}
+
+    def _new_timing(self):
+        return {'count': 0,
+                'total': 0.,
+                'max': 0.,
+                'histogram': [0] * (len(self.buckets) + 1),
+                }
+
+    def _add_timing(self, timing, duration):
+        timing['count'] += 1
+        timing['total'] += duration
+        timing['max'] = max(timing['max'], duration)
+        timing['histogram'][bisect.bisect_left(self.buckets, duration)] += 1
+
+    def add_event(self, event_name, listener_count, duration):
+        with self.lock:
+            timing = self.events.get(event_name)
+            if timing is None:
+                timing = self.events[event_name] = self._new_timing()
+                timing['listener_calls'] = 0
+            self._add_timing(timing, duration)
+            timing['listener_calls'] += listener_count
+
+    def add_listener(self, event_name, listener_name, duration, failed):
+        key = (event_name, listener_name)
+        with self.lock:
+            timing = self.listeners.get(key)
+            if timing is None:
+                timing = self.listeners[key] = self._new_timing()
+                timing['errors'] = 0
+            self._add_timing(timing, duration)
+            if failed:
+                timing['errors'] += 1
+
+    def get(self):
+        """ Return a copy of the statistics, serializable in JSON """
+        with self.lock:
+            events = {name: dict(timing, histogram=list(timing['histogram']))
+                      for name, timing in self.events.iteritems()}
+            listeners = [dict(timing,
+                              event=event_name,
+                              listener=listener_name,
+                              histogram=list(timing['histogram']))
+                         for (event_name, listener_name), timing
+                         in self.listeners.iteritems()]
+        return {'buckets': list(self.buckets),
+                'events': events,
+                'listeners': listeners,
+                }
+
+    def reset(self):
+        with self.lock:
+            self.events.clear()
+            self.listeners.clear()
+
+
+event_stats = EventStats()
+
+
+def _stats_enabled(env):
+    return env['ir.config_parameter']._get_connector_flag(
+        'connector_ecommerce.event_stats', default='True'
+    )
+
+
+def _get_listener_name(listener):
+    return '%s.%s' % (getattr(listener, '__module__', ''),
+                      getattr(listener, '__name__', repr(listener)))
+
+
+def dispatch_event(env, event, model_name, args):
+    """ Call the listeners of an event and record their timings in
+    :data:`event_stats`
+
+    The listeners are called the same way than
+    :meth:`openerp.addons.connector.event.Event.fire` does, but one by
+    one to measure them.
+    """
+    session = ConnectorSession.from_env(env)
+    if not isinstance(event, Event) or not _stats_enabled(env):
+        event.fire(session, model_name, *args)
+        return
+    event_name = _get_event_name(event) or repr(event)
+    listener_count = 0
+    event_start = time.time()
+    try:
+        for listener in event._consumers_for(session, model_name):
+            listener_count += 1
+            start = time.time()
+            failed = True
+            try:
+                listener(session, model_name, *args)
+                failed = False
+            finally:
+                event_stats.add_listener(event_name,
+                                         _get_listener_name(listener),
+                                         time.time() - start,
+                                         failed)
+    finally:
+        event_stats.add_event(event_name, listener_count,
+                              time.time() - event_start)
+
+
+class EventBuffer(object):
+    """ Events fired during a transaction, dispatched after its commit
+
+    The same event fired several times for the same model and arguments
+    is dispatched only once. When the transaction is rolled back, the
+    events are dropped.
+
+    The events are dispatched in a new cursor after the commit (the one
+    of the transaction is not usable anymore), which is committed once
+    all the listeners have been called. Each event is dispatched in a
+    savepoint: when a listener fails, only the work of the listeners of
+    this event is rolled back and the error is logged.
+    """
+
+    def __init__(self, cr):
+        self.dbname = cr.dbname
+        self.cr_ref = weakref.ref(cr)
+        self.events = OrderedDict()
+        cr.after('commit', self.flush)
+        cr.after('rollback', self.clear)
+
+    @staticmethod
+    def _key(event, model_name, args):
+        return (event, model_name,
+                tuple(tuple(arg) if isinstance(arg, list) else arg
+                      for arg in args))
+
+    def add(self, env, event, model_name, args):
+        key = self._key(event, model_name, args)
+        if key not in self.events:
+            self.events[key] = (env.uid, env.context, args)
+
+    def clear(self):
+        self.events.clear()
+        cr = self.cr_ref()
+        if cr is not None and _event_buffers.get(cr) is self:
+            del _event_buffers[cr]
+
+    def dispatch(self, env):
+        """ Fire the buffered events using the cursor of ``env`` """
+        for (event, model_name, __), values in self.events.iteritems():
+            uid, context, args = values
+            event_env = api.Environment(env.cr, uid, context)
+            try:
+                with env.cr.savepoint():
+                    dispatch_event(event_env, event, model_name, args)
+            except Exception:
+                _logger.exception('Error when dispatching the event %s '
+                                  'of %s %s buffered in a transaction',
+                                  _get_event_name(event) or repr(event),
+                                  model_name, args)
+                event_env.invalidate_all()
+
+    def flush(self):
+        try:
+            if not self.events:
+                return
+            registry = openerp.registry(self.dbname)
+            with api.Environment.manage():
+                with registry.cursor() as cr:
+                    env = api.Environment(cr, openerp.SUPERUSER_ID, {})
+                    self.dispatch(env)
+        except Exception:
+            _logger.exception('Error when dispatching the events buffered '
+                              'in a transaction')
+        finally:
+            self.clear()
+
+
+# {cursor: EventBuffer}
+_event_buffers = weakref.WeakKeyDictionary()
+
+
+def get_event_buffer(cr):
+    """ Return the buffer of events of the current transaction """
+    event_buffer = _event_buffers.get(cr)
+    if event_buffer is None:
+        event_buffer = _event_buffers[cr] = EventBuffer(cr)
+    return event_buffer
+
+
+def fire_event(env, event, model_name, *args):
+    """ Fire an event
+
+    When the key ``connector_coalesce_events`` is in the context, the
+    event is buffered, the duplicates are removed and it is dispatched
+    after the commit of the transaction (see :class:`EventBuffer`).
+    When the outbox is activated, the event is stored in the outbox
+    (``connector.event.outbox``) and dispatched after the commit.
+    Otherwise, the listeners are called immediately.
+
+    When the change feed is activated, the events of a record are also
+    added to the feed (``connector.change.feed``).
+
+    :param env: environment of the caller
+    :param event: :class:`openerp.addons.connector.event.Event`
+    :param model_name: name of the model
+    :param args: arguments for the listeners
+    """
+    event_name = _get_event_name(event)
+    if event_name and args and isinstance(args[0], (int, long)):
+        feed_model = env['connector.change.feed']
+        if feed_model._is_enabled():
+            kind = event_name
+            if kind.startswith('on_'):
+                kind = kind[3:]
+            feed_model._add_change(model_name, args[0], kind)
+    if env.context.get('connector_coalesce_events'):
+        get_event_buffer(env.cr).add(env, event, model_name, args)
+        return
+    outbox_model = env['connector.event.outbox']
+    if event_name and outbox_model._is_enabled():
+        outbox_model._enqueue(event_name, model_name, args)
+    else:
+        dispatch_event(env, event, model_name, args)
+
+
+for __name, __event in globals().items():
+    if isinstance(__event, Event):
+        register_outbox_event(__name, __event)
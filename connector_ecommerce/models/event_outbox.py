@@ -0,0 +1,265 @@
+# -*- coding: utf-8 -*-
+# © 2016 Camptocamp SA
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html)
+
+import json
+import logging
+import traceback
+import weakref
+
+import openerp
+from openerp import models, fields, api
+from openerp.addons.connector.queue.job import job
+from openerp.addons.connector.session import ConnectorSession
+
+from .event import outbox_events, dispatch_event
+
+_logger = logging.getLogger(__name__)
+
+# key of the advisory lock taken by the dispatchers of the outbox, only
+# one dispatcher at a time keeps the order of the events of a record
+OUTBOX_LOCK = 0x6f7574626f78
+
+# context keys kept with the events, the other keys of the context of
+# the caller are not kept for the listeners
+OUTBOX_CONTEXT_KEYS = ('lang', 'tz')
+
+# {cursor: True} when a dispatch is planned after the commit
+_dispatch_planned = weakref.WeakKeyDictionary()
+
+
+def dispatch_outbox(dbname):
+    """ Dispatch the pending events of the outbox
+
+    The events are read by batches, each batch is committed in its own
+    transaction once its listeners have been called. An event is
+    deleted only when its listeners succeeded, so an event can be
+    delivered more than once (when the transaction fails after the
+    call of its listeners) but is never lost.
+    """
+    try:
+        registry = openerp.registry(dbname)
+        last_id = 0
+        blocked = set()
+        with api.Environment.manage():
+            while True:
+                with registry.cursor() as cr:
+                    env = api.Environment(cr, openerp.SUPERUSER_ID, {})
+                    outbox_model = env['connector.event.outbox']
+                    last_id = outbox_model._dispatch_batch(last_id, blocked)
+                if not last_id:
+                    break
+    except Exception:
+        _logger.exception('Error when dispatching the events of the outbox')
+
+
+@job
+def dispatch_event_outbox(session, model_name):
+    """ Dispatch the pending events of the outbox """
+    dispatch_outbox(session.cr.dbname)
+
+
+class ConnectorEventOutbox(models.Model):
+    """ Events waiting to be dispatched to their listeners
+
+    When the outbox is activated (system parameter
+    ``connector_ecommerce.event_outbox``), the events fired in a
+    transaction are stored as rows of this model in the same
+    transaction. They are dispatched after the commit by a job, in the
+    order they were fired, so the listeners do not slow down the
+    business transaction and the events of a rolled back transaction
+    are never dispatched. A cron dispatches the events left behind.
+    """
+    _name = 'connector.event.outbox'
+    _description = 'Connector Event Outbox'
+    _order = 'id'
+
+    event_name = fields.Char(required=True, readonly=True)
+    model_name = fields.Char(required=True, readonly=True)
+    res_id = fields.Integer(
+        string='Record ID',
+        readonly=True,
+        help="ID of the record of the event, 0 when the event concerns "
+             "several records.",
+    )
+    args = fields.Text(string='Arguments', required=True, readonly=True)
+    user_id = fields.Many2one(comodel_name='res.users',
+                              string='User',
+                              readonly=True,
+                              ondelete='set null')
+    context_data = fields.Text(readonly=True)
+    state = fields.Selection(selection=[('pending', 'Pending'),
+                                        ('failed', 'Failed')],
+                             default='pending',
+                             required=True,
+                             readonly=True,
+                             index=True)
+    attempts = fields.Integer(readonly=True)
+    error = fields.Text(readonly=True)
+
+    @api.model
+    def _is_enabled(self):
+        """ Return True if the events have to be stored in the outbox
+
+        The key ``connector_event_outbox`` in the context has priority
+        over the system parameter.
+        """
+        if 'connector_event_outbox' in self.env.context:
+            return bool(self.env.context['connector_event_outbox'])
+        return self.env['ir.config_parameter']._get_connector_flag(
+            'connector_ecommerce.event_outbox'
+        )
+
+    @api.model
+    def _get_int_param(self, key, default):
+        params = self.env['ir.config_parameter'].sudo()
+        return int(params.get_param(key, default=default))
+
+    @api.model
+    def _enqueue(self, event_name, model_name, args):
+        """ Store an event in the outbox
+
+        The row is inserted with a single query, the ORM ``create`` is
+        too expensive for the number of events fired by the mass
+        operations.
+        """
+        res_id = args[0] if args and isinstance(args[0], (int, long)) else 0
+        context = {key: value for key, value in self.env.context.iteritems()
+                   if key in OUTBOX_CONTEXT_KEYS}
+        self.env.cr.execute(
+            "INSERT INTO connector_event_outbox "
+            "(event_name, model_name, res_id, args, user_id, context_data, "
+            " state, attempts, create_uid, create_date, write_uid, "
+            " write_date) "
+            "VALUES (%s, %s, %s, %s, %s, %s, 'pending', 0, %s, "
+            "        now() at time zone 'UTC', %s, "
+            "        now() at time zone 'UTC')",
+            (event_name, model_name, res_id, json.dumps(list(args)),
+             self.env.uid, json.dumps(context), self.env.uid, self.env.uid)
+        )
+        self._plan_dispatch()
+
+    @api.model
+    def _dispatch_inline(self):
+        """ Return True if the outbox is dispatched in the process of the
+        transaction right after its commit, instead of in a job (system
+        parameter ``connector_ecommerce.event_outbox_inline_dispatch``)
+
+        The inline dispatch delivers the events sooner, but the request
+        or job which committed the transaction waits for the listeners.
+        """
+        return self.env['ir.config_parameter']._get_connector_flag(
+            'connector_ecommerce.event_outbox_inline_dispatch'
+        )
+
+    @api.model
+    def _plan_dispatch(self):
+        """ Plan the dispatch of the outbox once per transaction
+
+        By default, a job is created in the transaction, so it is
+        committed along with the events and dispatches them in a job
+        runner, without delaying the caller.
+        """
+        cr = self.env.cr
+        if cr in _dispatch_planned:
+            return
+        _dispatch_planned[cr] = True
+        dbname = cr.dbname
+        inline = self._dispatch_inline()
+        if not inline:
+            session = ConnectorSession.from_env(self.env)
+            dispatch_event_outbox.delay(
+                session, self._name,
+                description='Dispatch the connector event outbox',
+            )
+
+        def after_commit():
+            _dispatch_planned.pop(cr, None)
+            if inline:
+                dispatch_outbox(dbname)
+
+        def after_rollback():
+            _dispatch_planned.pop(cr, None)
+
+        cr.after('commit', after_commit)
+        cr.after('rollback', after_rollback)
+
+    @api.multi
+    def _fire(self):
+        """ Call the listeners of the event """
+        self.ensure_one()
+        event = outbox_events.get(self.event_name)
+        if event is None:
+            raise ValueError('Unknown event %s' % self.event_name)
+        context = json.loads(self.context_data or '{}')
+        env = api.Environment(self.env.cr,
+                              self.user_id.id or openerp.SUPERUSER_ID,
+                              context)
+        dispatch_event(env, event, self.model_name, json.loads(self.args))
+
+    @api.model
+    def _dispatch_batch(self, last_id, blocked):
+        """ Dispatch a batch of events stored after ``last_id``
+
+        The events of a record are dispatched in the order they have
+        been fired: when the listeners of an event fail, the next
+        events of the same record are not dispatched (``blocked``),
+        they will be retried with the failed event on the next
+        dispatch.
+
+        :param last_id: the id of the last event read by the dispatcher
+        :param blocked: set of (model, record id) which failed, updated
+                        by the method
+        :return: the id of the last event of the batch, 0 when there is
+                 nothing more to dispatch or when another dispatcher is
+                 running
+        """
+        self.env.cr.execute("SELECT pg_try_advisory_xact_lock(%s)",
+                            (OUTBOX_LOCK,))
+        if not self.env.cr.fetchone()[0]:
+            return 0
+        batch_size = self._get_int_param(
+            'connector_ecommerce.event_outbox_batch_size', 500
+        )
+        max_attempts = self._get_int_param(
+            'connector_ecommerce.event_outbox_max_attempts', 5
+        )
+        events = self.search([('state', '=', 'pending'),
+                              ('id', '>', last_id)],
+                             limit=batch_size)
+        dispatched = self.browse()
+        for event in events:
+            key = (event.model_name, event.res_id or event.event_name)
+            if key in blocked:
+                continue
+            try:
+                with self.env.cr.savepoint():
+                    event._fire()
+            except Exception:
+                blocked.add(key)
+                attempts = event.attempts + 1
+                event.write({
+                    'attempts': attempts,
+                    'error': traceback.format_exc(),
+                    'state': ('failed' if attempts >= max_attempts
+                              else 'pending'),
+                })
+                _logger.exception('Error when dispatching the event %s of '
+                                  'the outbox', event.id)
+            else:
+                dispatched |= event
+        dispatched.unlink()
+        return events[-1].id if events else 0
+
+    @api.model
+    def _cron_dispatch(self):
+        """ Dispatch the events which have not been dispatched after
+        the commit of their transaction """
+        dispatch_outbox(self.env.cr.dbname)
+        return True
+
+    @api.multi
+    def action_retry(self):
+        """ Put back the failed events in the queue """
+        self.write({'state': 'pending', 'attempts': 0, 'error': False})
+        return True
@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+# © 2016 Camptocamp SA
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html)
+
+from openerp import models, api, SUPERUSER_ID, _
+from openerp.exceptions import AccessError
+
+from .event import event_stats
+
+
+class ConnectorEventStats(models.AbstractModel):
+    """ Access to the statistics of the dispatch of the events
+
+    The statistics are collected by each process (see
+    :class:`~openerp.addons.connector_ecommerce.models.event.EventStats`),
+    so with several workers, each call returns the statistics of the
+    worker which handles the request. The collect can be deactivated
+    with the system parameter ``connector_ecommerce.event_stats``.
+    """
+    _name = 'connector.event.stats'
+    _description = 'Connector Event Statistics'
+
+    @api.model
+    def _check_access(self):
+        if self.env.uid == SUPERUSER_ID:
+            return
+        if not self.env.user.has_group('connector.group_connector_manager'):
+            raise AccessError(
+                _('Only the connector managers can read the statistics '
+                  'of the events.')
+            )
+
+    @api.model
+    def get_stats(self):
+        """ Return the statistics of the events and of their listeners
+
+        Durations are in seconds, ``buckets`` contains the upper
+        bounds of the buckets of the histograms.
+        """
+        self._check_access()
+        return event_stats.get()
+
+    @api.model
+    def reset_stats(self):
+        self._check_access()
+        event_stats.reset()
+        return True
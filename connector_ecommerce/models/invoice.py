@@ -3,25 +3,51 @@
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html)
 
 from openerp import models, api
-from openerp.addons.connector.session import ConnectorSession
-from .event import on_invoice_paid, on_invoice_validated
+from .event import (on_invoice_paid,
+                    on_invoice_paid_batch,
+                    on_invoice_validated,
+                    on_invoice_validated_batch,
+                    fire_event)
+from .binding import get_bound_backends, filter_bound
 
 
 class AccountInvoice(models.Model):
     _inherit = 'account.invoice'
 
+    @api.multi
+    def _get_bound_backends(self):
+        """ Return {invoice id: set of (backend model, backend id)} of
+        the invoices having a binding or coming from sales orders having
+        a binding """
+        backends = get_bound_backends(self.env, self._name, self.ids)
+        order_field = 'invoice_line_ids.sale_line_ids.order_id'
+        sale_backends = self.mapped(order_field)._get_bound_backends()
+        if sale_backends:
+            for invoice in self:
+                for order in invoice.mapped(order_field):
+                    if order.id in sale_backends:
+                        backends[invoice.id] |= sale_backends[order.id]
+        return backends
+
     @api.multi
     def confirm_paid(self):
         res = super(AccountInvoice, self).confirm_paid()
-        session = ConnectorSession.from_env(self.env)
-        for record_id in self.ids:
-            on_invoice_paid.fire(session, self._name, record_id)
+        invoices = filter_bound(self)
+        for record_id in invoices.ids:
+            fire_event(self.env, on_invoice_paid, self._name, record_id)
+        if invoices:
+            fire_event(self.env, on_invoice_paid_batch, self._name,
+                       invoices.ids)
         return res
 
     @api.multi
     def invoice_validate(self):
         res = super(AccountInvoice, self).invoice_validate()
-        session = ConnectorSession.from_env(self.env)
-        for record_id in self.ids:
-            on_invoice_validated.fire(session, self._name, record_id)
+        invoices = filter_bound(self)
+        for record_id in invoices.ids:
+            fire_event(self.env, on_invoice_validated,
+                       self._name, record_id)
+        if invoices:
+            fire_event(self.env, on_invoice_validated_batch,
+                       self._name, invoices.ids)
         return res
@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+# © 2016 Camptocamp SA
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html)
+
+from openerp import models, api, tools
+
+CACHED_PARAM_PREFIX = 'connector_ecommerce.'
+
+
+class IrConfigParameter(models.Model):
+    _inherit = 'ir.config_parameter'
+
+    @api.model
+    @tools.ormcache('key', 'default')
+    def _get_connector_flag(self, key, default='False'):
+        """ Return the boolean value of a system parameter of the
+        connector
+
+        The parameters are read on each event fired, so their values
+        are kept in the registry's cache, which is cleared when a
+        parameter of the connector is created, modified or deleted.
+        """
+        value = self.sudo().get_param(key, default=default)
+        return value in ('1', 'True', 'true')
+
+    @api.multi
+    def _clear_connector_flags(self, keys):
+        if any(key and key.startswith(CACHED_PARAM_PREFIX) for key in keys):
+            self.clear_caches()
+
+    @api.model
+    def create(self, vals):
+        param = super(IrConfigParameter, self).create(vals)
+        self._clear_connector_flags([vals.get('key')])
+        return param
+
+    @api.multi
+    def write(self, vals):
+        keys = self.mapped('key') + [vals.get('key')]
+        result = super(IrConfigParameter, self).write(vals)
+        self._clear_connector_flags(keys)
+        return result
+
+    @api.multi
+    def unlink(self):
+        keys = self.mapped('key')
+        result = super(IrConfigParameter, self).unlink()
+        self._clear_connector_flags(keys)
+        return result
@@ -2,47 +2,175 @@
 # © 2011-2013 Akretion (Sébastien Beau)
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html)
 
-from openerp import models, fields, api
-from openerp.addons.connector.session import ConnectorSession
-from .event import on_product_price_changed
+from openerp import models, fields, api, tools, exceptions, _
+from .event import (on_product_price_changed,
+                    on_product_price_changed_batch,
+                    fire_event)
+from .binding import get_bound_backends, filter_bound
+
+
+# {database name: ids of the products returned by
+# ``_get_special_line_product`` in this process}
+_special_line_product_ids = {}
+
+# modules of the xmlids created by the imports and exports of data,
+# the products having only such xmlids are not special line products
+IMPORT_XMLID_MODULES = ('__export__', '__import__')
+
+
+def _read_prices(records, fieldnames):
+    """ Return {id: tuple of the values of the fields} of the records
+
+    The fields are read for all the records at once thanks to the
+    prefetching.
+    """
+    return {record.id: tuple(record[fieldname] for fieldname in fieldnames)
+            for record in records}
+
+
+def _price_snapshot(records, vals):
+    """ Read the prices of the records before a write
+
+    Returns None when ``vals`` contains no price field.
+    """
+    if not records._price_changed_fields().intersection(vals):
+        return None
+    return _read_prices(records, records._price_snapshot_fields())
+
+
+def _filter_price_changed(records, snapshot):
+    """ Return the records whose prices differ from the snapshot taken
+    before a write """
+    if snapshot is None:
+        return records
+    fieldnames = records._price_snapshot_fields()
+    records.invalidate_cache(fieldnames, records.ids)
+    prices = _read_prices(records, fieldnames)
+    return records.filtered(
+        lambda record: prices[record.id] != snapshot[record.id]
+    )
+
+
+def _filter_price_moved(products):
+    """ Return the products whose effective price moved, when the price
+    delta is activated (see ``connector.product.price``) """
+    price_model = products.env['connector.product.price']
+    if not products or not price_model._is_enabled():
+        return products
+    return price_model.filter_price_moved(products)
 
 
 class ProductTemplate(models.Model):
     _inherit = 'product.template'
 
-    # TODO implement set function and also support multi tax
-    @api.one
-    @api.depends('taxes_id.tax_group_id')
+    @api.multi
+    def _get_tax_company_id(self):
+        """ Company of the taxes handled by ``tax_group_id`` """
+        self.ensure_one()
+        return self.company_id.id or self.env.user.company_id.id
+
+    @api.depends('taxes_id.tax_group_id', 'taxes_id.company_id',
+                 'company_id')
     def _compute_tax_group_id(self):
-        taxes = self.taxes_id
-        self.tax_group_id = taxes[:-1].tax_group_id.id
+        """ The tax group is the group shared by all the taxes of the
+        company of the product, empty when the taxes have different
+        groups """
+        # read the taxes and their group for all the templates at once
+        self.mapped('taxes_id.tax_group_id')
+        for template in self:
+            company_id = template._get_tax_company_id()
+            group_ids = set(tax.tax_group_id.id for tax in template.taxes_id
+                            if tax.company_id.id == company_id)
+            if len(group_ids) == 1:
+                template.tax_group_id = group_ids.pop()
+            else:
+                template.tax_group_id = False
+
+    @api.multi
+    def _inverse_tax_group_id(self):
+        """ Replace the taxes of the company of the template which are
+        not in the tax group by the first sale tax of the group
+
+        The taxes of the company already in the group are kept, the
+        first sale tax of the group is added only when there is none.
+        An error is raised when the group has no sale tax for the
+        company. The taxes of the other companies are kept. Emptying the
+        group leaves the taxes untouched: it does not tell which taxes
+        to remove. The templates having the same resulting taxes are
+        written together.
+        """
+        tax_model = self.env['account.tax']
+        templates_by_taxes = {}
+        for template in self:
+            group_id = template.tax_group_id.id
+            if not group_id:
+                continue
+            company_id = template._get_tax_company_id()
+            other_ids = set(tax.id for tax in template.taxes_id
+                            if tax.company_id.id != company_id)
+            group_ids = set(tax.id for tax in template.taxes_id
+                            if tax.company_id.id == company_id and
+                            tax.tax_group_id.id == group_id)
+            if not group_ids:
+                index = tax_model._get_tax_group_index(company_id)
+                group_ids = set(index.get(group_id, ())[:1])
+            if not group_ids:
+                raise exceptions.UserError(
+                    _('The tax group %s has no sale tax for the company '
+                      'of the product %s.') %
+                    (template.tax_group_id.name, template.name)
+                )
+            tax_ids = other_ids | group_ids
+            key = tuple(sorted(tax_ids))
+            if key == tuple(sorted(template.taxes_id.ids)):
+                continue
+            templates_by_taxes.setdefault(key, self.browse())
+            templates_by_taxes[key] |= template
+        for tax_ids, templates in templates_by_taxes.iteritems():
+            templates.write({'taxes_id': [(6, 0, list(tax_ids))]})
+
     tax_group_id = fields.Many2one(
         comodel_name='account.tax.group',
         compute='_compute_tax_group_id',
+        inverse='_inverse_tax_group_id',
         string='Tax Group',
         help='Tax groups are used with some external '
              'system like Prestashop',
     )
 
+    @api.multi
+    def _get_bound_backends(self):
+        """ Return {template id: set of (backend model, backend id)} of
+        the templates having a binding """
+        return get_bound_backends(self.env, self._name, self.ids)
+
     @api.model
     def _price_changed_fields(self):
         return {'list_price', 'lst_price', 'standard_price'}
 
+    @api.model
+    def _price_snapshot_fields(self):
+        """ Fields compared before and after a write, the price events
+        are fired only for the records where one of them changed """
+        return ['list_price', 'standard_price']
+
     @api.multi
     def _price_changed(self, vals):
         """ Fire the ``on_product_price_changed`` on all the variants of
         the template if the price of the product could have changed.
+        ``on_product_price_changed_batch`` is fired once for all the
+        variants.
 
         If one of the field used in a sale pricelist item has been
         modified, we consider that the price could have changed.
 
         There is no guarantee that's the price actually changed,
-        because it depends on the pricelists.
+        because it depends on the pricelists, unless the price delta is
+        activated (``connector.product.price``).
         """
         price_fields = self._price_changed_fields()
         if any(field in vals for field in price_fields):
             product_model = self.env['product.product']
-            session = ConnectorSession.from_env(self.env)
             products = product_model.search(
                 [('product_tmpl_id', 'in', self.ids)]
             )
@@ -52,65 +180,190 @@ class ProductTemplate(models.Model):
                 from_product_ids = self.env.context['from_product_ids']
                 remove_products = product_model.browse(from_product_ids)
                 products -= remove_products
+            products = _filter_price_moved(filter_bound(products))
             for product in products:
-                on_product_price_changed.fire(session,
-                                              product_model._name,
-                                              product.id)
+                fire_event(self.env, on_product_price_changed,
+                           product_model._name, product.id)
+            if products:
+                fire_event(self.env, on_product_price_changed_batch,
+                           product_model._name, products.ids)
 
     @api.multi
     def write(self, vals):
+        snapshot = _price_snapshot(self, vals)
         result = super(ProductTemplate, self).write(vals)
-        self._price_changed(vals)
+        changed = _filter_price_changed(self, snapshot)
+        if changed:
+            changed._price_changed(vals)
+        self.mapped('product_variant_ids')._clear_special_line_cache(vals)
         return result
 
 
 class ProductProduct(models.Model):
     _inherit = 'product.product'
 
+    @api.model
+    def _get_checkpoint_product_ids(self, product_ids=None):
+        """ Return the ids of the products having a checkpoint to review
+
+        :param product_ids: restrict the search to these products
+        :return: set of ids
+        """
+        domain = [('model_id.model', '=', self._name),
+                  ('state', '=', 'need_review')]
+        if product_ids is not None:
+            domain.append(('record_id', 'in', product_ids))
+        groups = self.env['connector.checkpoint'].read_group(
+            domain, ['record_id'], ['record_id']
+        )
+        return {group['record_id'] for group in groups}
+
     @api.depends()
     def _compute_has_checkpoint(self):
-        checkpoint_model = self.env['connector.checkpoint']
-        model_model = self.env['ir.model']
-        model = model_model.search([('model', '=', 'product.product')])
+        # new records (onchanges) have no checkpoint
+        product_ids = [product_id for product_id in self.ids
+                       if isinstance(product_id, (int, long))]
+        if product_ids:
+            checkpoint_ids = self._get_checkpoint_product_ids(product_ids)
+        else:
+            checkpoint_ids = set()
         for product in self:
-            points = checkpoint_model.search([('model_id', '=', model.id),
-                                              ('record_id', '=', product.id),
-                                              ('state', '=', 'need_review')],
-                                             limit=1,
-                                             )
-            product.has_checkpoint = bool(points)
+            product.has_checkpoint = product.id in checkpoint_ids
+
+    @api.model
+    def _search_has_checkpoint(self, operator, value):
+        if operator not in ('=', '!='):
+            raise ValueError('Unsupported operator %s for has_checkpoint' %
+                             operator)
+        product_ids = list(self._get_checkpoint_product_ids())
+        if (operator == '=') == bool(value):
+            return [('id', 'in', product_ids)]
+        return [('id', 'not in', product_ids)]
 
     has_checkpoint = fields.Boolean(compute='_compute_has_checkpoint',
+                                    search='_search_has_checkpoint',
                                     string='Has Checkpoint')
 
+    @api.multi
+    def _get_bound_backends(self):
+        """ Return {product id: set of (backend model, backend id)} of
+        the products having a binding, on the variant or on its
+        template """
+        backends = get_bound_backends(self.env, self._name, self.ids)
+        templates = self.mapped('product_tmpl_id')
+        template_backends = templates._get_bound_backends()
+        if template_backends:
+            for product in self:
+                template_id = product.product_tmpl_id.id
+                if template_id in template_backends:
+                    backends[product.id] |= template_backends[template_id]
+        return backends
+
     @api.model
     def _price_changed_fields(self):
         return {'lst_price', 'standard_price', 'price', 'price_extra'}
 
+    @api.model
+    def _price_snapshot_fields(self):
+        """ Fields compared before and after a write, the price events
+        are fired only for the records where one of them changed """
+        return ['lst_price', 'standard_price', 'price_extra']
+
     @api.multi
     def _price_changed(self, vals):
         """ Fire the ``on_product_price_changed`` if the price
-        of the product could have changed.
+        of the product could have changed, and
+        ``on_product_price_changed_batch`` for all the products.
 
         If one of the field used in a sale pricelist item has been
         modified, we consider that the price could have changed.
 
         There is no guarantee that's the price actually changed,
-        because it depends on the pricelists.
+        because it depends on the pricelists, unless the price delta is
+        activated (``connector.product.price``).
         """
         price_fields = self._price_changed_fields()
         if any(field in vals for field in price_fields):
-            session = ConnectorSession.from_env(self.env)
-            for prod_id in self.ids:
-                on_product_price_changed.fire(session, self._name, prod_id)
+            products = _filter_price_moved(filter_bound(self))
+            for prod_id in products.ids:
+                fire_event(self.env, on_product_price_changed,
+                           self._name, prod_id)
+            if products:
+                fire_event(self.env, on_product_price_changed_batch,
+                           self._name, products.ids)
+
+    @api.model
+    @tools.ormcache('xmlid', "self.env.context.get('lang')")
+    def _get_special_line_product(self, xmlid):
+        """ Return the values of a product used in the special lines
+        (shipping, cash on delivery, gift, ...) of the sales orders
+
+        The same few products are used for every imported sales order,
+        so the values are cached. The cache is cleared when the name or
+        the unit of measure of a product having a xmlid is modified.
+
+        :param xmlid: complete xmlid of the product (module.name)
+        :return: dict with the 'id', 'name' and 'uom_id' of the product
+        """
+        product = self.env.ref(xmlid)
+        _special_line_product_ids.setdefault(
+            self.env.cr.dbname, set()
+        ).add(product.id)
+        return {'id': product.id,
+                'name': product.name,
+                'uom_id': product.uom_id.id,
+                }
+
+    @api.multi
+    def _is_special_line_product(self):
+        """ Return True if one of the products may be in the cache of
+        ``_get_special_line_product``
+
+        The products cached by this process are known. The other
+        processes may have cached any product having a xmlid, except
+        the xmlids of the imported data, which are not used as
+        references of special lines.
+        """
+        cached_ids = _special_line_product_ids.get(self.env.cr.dbname, ())
+        if cached_ids and not cached_ids.isdisjoint(self.ids):
+            return True
+        return bool(self.env['ir.model.data'].sudo().search_count(
+            [('model', '=', self._name),
+             ('res_id', 'in', self.ids),
+             ('module', 'not in', IMPORT_XMLID_MODULES)]
+        ))
+
+    @api.multi
+    def _clear_special_line_cache(self, vals=None):
+        """ Clear the cache of ``_get_special_line_product`` when one of
+        the products may be in it
+
+        :param vals: values written on the products, None when they are
+                     deleted
+        """
+        if not self:
+            return
+        if vals is not None and not {'name', 'uom_id'}.intersection(vals):
+            return
+        if self._is_special_line_product():
+            self.clear_caches()
 
     @api.multi
     def write(self, vals):
+        snapshot = _price_snapshot(self, vals)
         self_context = self.with_context(from_product_ids=self.ids)
         result = super(ProductProduct, self_context).write(vals)
-        self._price_changed(vals)
+        changed = _filter_price_changed(self, snapshot)
+        if changed:
+            changed._price_changed(vals)
+        self._clear_special_line_cache(vals)
         return result
 
+    @api.multi
+    def unlink(self):
+        self._clear_special_line_cache()
+        return super(ProductProduct, self).unlink()
+
     @api.model
     def create(self, vals):
         product = super(ProductProduct, self).create(vals)
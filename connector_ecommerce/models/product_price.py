@@ -0,0 +1,254 @@
+# -*- coding: utf-8 -*-
+# © 2016 Camptocamp SA
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html)
+
+import logging
+
+import psycopg2
+
+from openerp import models, fields, api, tools
+from openerp.tools import float_compare
+
+_logger = logging.getLogger(__name__)
+
+
+class ConnectorProductPrice(models.Model):
+    """ Last prices of the products notified to the connectors
+
+    When the price delta is activated (system parameter
+    ``connector_ecommerce.price_delta``), the effective prices of the
+    products on the pricelists of the backends are compared with the
+    prices stored here, and ``on_product_price_changed`` is fired only
+    for the products whose price moved. The prices are stored when the
+    event is fired, the connectors can store the prices they actually
+    exported with :meth:`store_prices`.
+    """
+    _name = 'connector.product.price'
+    _description = 'Connector Product Price'
+    _log_access = False
+
+    product_id = fields.Many2one(comodel_name='product.product',
+                                 required=True,
+                                 ondelete='cascade')
+    pricelist_id = fields.Many2one(comodel_name='product.pricelist',
+                                   required=True,
+                                   ondelete='cascade')
+    price = fields.Float()
+
+    _sql_constraints = [
+        ('product_pricelist_uniq', 'unique(product_id, pricelist_id)',
+         'A product can have only one price per pricelist.'),
+    ]
+
+    @api.model
+    def _is_enabled(self):
+        params = self.env['ir.config_parameter'].sudo()
+        return params.get_param('connector_ecommerce.price_delta',
+                                default='False') in ('1', 'True', 'true')
+
+    @api.model
+    @tools.ormcache()
+    def _get_backend_pricelist_ids(self):
+        """ Return the ids of the pricelists of the backends having a
+        ``pricelist_id`` field
+
+        The ids are kept in the registry's cache and are cleared when
+        a backend is created, deleted or its pricelist is modified.
+        """
+        pricelists = self.env['product.pricelist'].browse()
+        for name in self._get_backend_models():
+            backends = self.env[name].sudo().search([])
+            pricelists |= backends.mapped('pricelist_id')
+        return tuple(pricelists.ids)
+
+    @api.model
+    def _get_backend_models(self):
+        """ Return the names of the backend models having a
+        ``pricelist_id`` field """
+        names = []
+        for name in self.env.registry:
+            model = self.env[name]
+            if (getattr(model, '_backend_type', None) and
+                    not model._abstract and
+                    'pricelist_id' in model._fields):
+                names.append(name)
+        return names
+
+    @api.model
+    def _get_pricelists(self):
+        """ Pricelists on which the prices are compared
+
+        By default, the pricelists of the backends having a
+        ``pricelist_id`` field. The connectors using other pricelists
+        should extend this method.
+        """
+        return self.env['product.pricelist'].browse(
+            self._get_backend_pricelist_ids()
+        )
+
+    @api.model
+    def _get_stored_prices(self, products, pricelists):
+        """ Return {(product id, pricelist id): (row id, price)} """
+        self.env.cr.execute(
+            "SELECT id, product_id, pricelist_id, price "
+            "FROM connector_product_price "
+            "WHERE product_id IN %s AND pricelist_id IN %s",
+            (tuple(products.ids), tuple(pricelists.ids))
+        )
+        return {(product_id, pricelist_id): (row_id, price)
+                for row_id, product_id, pricelist_id, price
+                in self.env.cr.fetchall()}
+
+    @api.model
+    def _compute_prices(self, products, pricelists):
+        """ Compute the prices of all the products on all the pricelists
+
+        :return: {(product id, pricelist id): price}
+        """
+        products_by_qty_by_partner = [(product, 1.0, False)
+                                      for product in products]
+        results = pricelists.price_rule_get_multi(products_by_qty_by_partner)
+        prices = {}
+        for product_id, by_pricelist in results.iteritems():
+            for pricelist_id, (price, __) in by_pricelist.iteritems():
+                prices[(product_id, pricelist_id)] = price
+        return prices
+
+    @api.model
+    def store_prices(self, prices):
+        """ Store the prices of products, replacing the existing ones
+
+        Existing prices are updated with one query and the new ones
+        are inserted with one query. The prices are only a bookkeeping
+        of the events fired: when a concurrent transaction stores the
+        price of the same product and pricelist, its price is kept and
+        the write of the caller does not fail.
+
+        :param prices: {(product id, pricelist id): price}
+        """
+        if not prices:
+            return
+        product_ids = set(key[0] for key in prices)
+        pricelist_ids = set(key[1] for key in prices)
+        stored = self._get_stored_prices(
+            self.env['product.product'].browse(list(product_ids)),
+            self.env['product.pricelist'].browse(list(pricelist_ids)),
+        )
+        updates = []
+        inserts = []
+        for key, price in prices.iteritems():
+            if key in stored:
+                updates.append((stored[key][0], price))
+            else:
+                inserts.append((key[0], key[1], price))
+        if updates:
+            try:
+                self._update_prices(updates)
+            except psycopg2.extensions.TransactionRollbackError:
+                # updated by a concurrent transaction
+                _logger.debug('Prices updated by another transaction, '
+                              'kept as is')
+        if inserts:
+            try:
+                self._insert_prices(inserts)
+            except psycopg2.IntegrityError:
+                # some of the prices are inserted by a concurrent
+                # transaction, insert the others one by one
+                for insert in inserts:
+                    try:
+                        self._insert_prices([insert])
+                    except psycopg2.IntegrityError:
+                        _logger.debug('Price of the product %s on the '
+                                      'pricelist %s inserted by another '
+                                      'transaction', insert[0], insert[1])
+        self.invalidate_cache()
+
+    @api.model
+    def _update_prices(self, updates):
+        """ Update the stored prices, in a savepoint
+
+        :param updates: list of (row id, price)
+        """
+        values = ', '.join(['(%s, %s)'] * len(updates))
+        with self.env.cr.savepoint():
+            self.env.cr.execute(
+                "UPDATE connector_product_price AS p "
+                "SET price = v.price "
+                "FROM (VALUES %s) AS v(id, price) "
+                "WHERE p.id = v.id" % values,
+                [value for update in updates for value in update],
+                log_exceptions=False
+            )
+
+    @api.model
+    def _insert_prices(self, inserts):
+        """ Insert new prices, in a savepoint
+
+        :param inserts: list of (product id, pricelist id, price)
+        """
+        values = ', '.join(['(%s, %s, %s)'] * len(inserts))
+        with self.env.cr.savepoint():
+            self.env.cr.execute(
+                "INSERT INTO connector_product_price "
+                "(product_id, pricelist_id, price) VALUES %s" % values,
+                [value for insert in inserts for value in insert],
+                log_exceptions=False
+            )
+
+    @api.model
+    def filter_price_moved(self, products):
+        """ Return the products whose effective price moved on at least
+        one pricelist since the last stored price, and store the new
+        prices
+
+        All the prices are computed at once, with one read of the stored
+        prices for all the products.
+        """
+        pricelists = self._get_pricelists()
+        if not products or not pricelists:
+            return products
+        prices = self._compute_prices(products, pricelists)
+        stored = self._get_stored_prices(products, pricelists)
+        digits = self.env['decimal.precision'].precision_get('Product Price')
+        moved_ids = set()
+        changed_prices = {}
+        for key, price in prices.iteritems():
+            if key in stored and float_compare(
+                    price, stored[key][1], precision_digits=digits) == 0:
+                continue
+            moved_ids.add(key[0])
+            changed_prices[key] = price
+        self.store_prices(changed_prices)
+        return products.filtered(lambda product: product.id in moved_ids)
+
+
+class ConnectorBackend(models.AbstractModel):
+    _inherit = 'connector.backend'
+
+    @api.model
+    def _clear_pricelist_cache(self):
+        """ Clear the pricelists of the backends used by the price delta
+        (``connector.product.price``) """
+        self.env['connector.product.price'].clear_caches()
+
+    @api.model
+    def create(self, vals):
+        backend = super(ConnectorBackend, self).create(vals)
+        if 'pricelist_id' in self._fields:
+            self._clear_pricelist_cache()
+        return backend
+
+    @api.multi
+    def write(self, vals):
+        result = super(ConnectorBackend, self).write(vals)
+        if 'pricelist_id' in vals:
+            self._clear_pricelist_cache()
+        return result
+
+    @api.multi
+    def unlink(self):
+        has_pricelist = 'pricelist_id' in self._fields
+        result = super(ConnectorBackend, self).unlink()
+        if has_pricelist:
+            self._clear_pricelist_cache()
+        return result
@@ -5,12 +5,77 @@
 # -*- coding: utf-8 -*-
 
 import logging
+from collections import defaultdict
+
+import psycopg2
 
 from openerp import models, fields, api, exceptions, _, osv
+from openerp.addons.connector.exception import RetryableJobError
+from openerp.addons.connector.queue.job import job
+from openerp.addons.connector.session import ConnectorSession
+
+from .binding import get_bound_backends
 
 _logger = logging.getLogger(__name__)
 
 
+def _first_message_ids(env, model_name, res_ids):
+    """ Return the first message of each record, which is the parent of
+    the new messages of flat threads (as in ``message_post``): the first
+    email if any, the first message otherwise
+
+    :return: {res_id: message id}
+    """
+    env.cr.execute("SELECT DISTINCT ON (res_id) res_id, id "
+                   "FROM mail_message "
+                   "WHERE model = %s AND res_id IN %s "
+                   "ORDER BY res_id, message_type != 'email', id",
+                   (model_name, tuple(res_ids)))
+    return dict(env.cr.fetchall())
+
+
+def message_post_bulk(env, messages):
+    """ Post notes on many records at once
+
+    Gives the same messages as ``record.message_post(body=body)`` for
+    each record, but the author and subtype are computed once, the
+    parent messages are found with one query per model, and
+    ``message_last_post`` is written with one query per model. The
+    followers are notified by ``mail.message`` as with ``message_post``.
+
+    :param messages: list of tuples (record, body)
+    """
+    if not messages:
+        return
+    message_model = env['mail.message']
+    author_id = env.user.partner_id.id
+    subtype_id = env['ir.model.data'].xmlid_to_res_id('mail.mt_note')
+    by_model = defaultdict(list)
+    for record, body in messages:
+        by_model[record._name].append((record.id, body))
+    now = fields.Datetime.now()
+    for model_name, model_messages in by_model.iteritems():
+        model = env[model_name]
+        res_ids = list({res_id for res_id, __ in model_messages})
+        parents = {}
+        if model._mail_flat_thread:
+            parents = _first_message_ids(env, model_name, res_ids)
+        for res_id, body in model_messages:
+            message = message_model.create({
+                'author_id': author_id,
+                'model': model_name,
+                'res_id': res_id,
+                'body': body,
+                'subject': False,
+                'message_type': 'notification',
+                'parent_id': parents.get(res_id, False),
+                'subtype_id': subtype_id,
+            })
+            if model._mail_flat_thread:
+                parents.setdefault(res_id, message.id)
+        model.browse(res_ids).sudo().write({'message_last_post': now})
+
+
 class SaleOrder(models.Model):
     """ Add a cancellation mecanism in the sales orders
 
@@ -51,6 +116,8 @@ class SaleOrder(models.Model):
     need_cancel = fields.Boolean(compute='_compute_need_cancel',
                                  string='Need to be canceled',
                                  copy=False,
+                                 store=True,
+                                 index=True,
                                  help='Has been canceled on the backend'
                                       ', need to be canceled.')
     parent_need_cancel = fields.Boolean(
@@ -70,16 +137,52 @@ class SaleOrder(models.Model):
         """
         self.parent_id = False
 
-    @api.one
     @api.depends('canceled_in_backend', 'cancellation_resolved')
     def _compute_need_cancel(self):
         """ Return True if the sales order need to be canceled
         (has been canceled on the Backend)
         """
-        self.need_cancel = (self.canceled_in_backend and
-                            not self.cancellation_resolved)
+        for order in self:
+            order.need_cancel = (order.canceled_in_backend and
+                                 not order.cancellation_resolved)
+
+    @api.multi
+    def _get_ancestor_ids(self):
+        """ Return the ids of all the parent sales orders of the orders
+
+        The parents are resolved level by level for the whole recordset,
+        so ``parent_id`` is computed in batch for each level. A cycle in
+        the parents (which is an error in a connector) stops the chain.
+
+        :return: {order id: ids of the ancestors, the nearest first}
+        """
+        parent_of = {}
+        level = self
+        while level:
+            next_ids = set()
+            for order in level:
+                parent_id = order.parent_id.id
+                parent_of[order.id] = parent_id
+                if parent_id and parent_id not in parent_of:
+                    next_ids.add(parent_id)
+            level = self.browse(list(next_ids))
+
+        ancestors = {}
+        for order in self:
+            chain = []
+            seen = {order.id}
+            parent_id = parent_of[order.id]
+            while parent_id:
+                if parent_id in seen:
+                    _logger.warning('The parent sales orders of %s form a '
+                                    'cycle: %s', order.name, chain)
+                    break
+                chain.append(parent_id)
+                seen.add(parent_id)
+                parent_id = parent_of.get(parent_id)
+            ancestors[order.id] = chain
+        return ancestors
 
-    @api.one
     @api.depends('need_cancel', 'parent_id',
                  'parent_id.need_cancel', 'parent_id.parent_need_cancel')
     def _compute_parent_need_cancel(self):
@@ -87,12 +190,62 @@ class SaleOrder(models.Model):
         be canceled (has been canceled on the backend).
         Follows all the parent sales orders.
         """
-        self.parent_need_cancel = False
-        order = self.parent_id
-        while order:
-            if order.need_cancel:
-                self.parent_need_cancel = True
-            order = order.parent_id
+        ancestors = self._get_ancestor_ids()
+        ancestor_ids = set()
+        for chain in ancestors.itervalues():
+            ancestor_ids.update(chain)
+        need_cancel_ids = set(
+            self.browse(list(ancestor_ids)).filtered('need_cancel').ids
+        )
+        for order in self:
+            order.parent_need_cancel = any(
+                parent_id in need_cancel_ids
+                for parent_id in ancestors[order.id]
+            )
+
+    @api.model
+    def _auto_cancel_chunk_size(self):
+        """ Number of sales orders canceled together by
+        ``_try_auto_cancel`` and by each job of ``_auto_cancel`` """
+        params = self.env['ir.config_parameter'].sudo()
+        return int(params.get_param(
+            'connector_ecommerce.auto_cancel_chunk_size', default=100
+        ))
+
+    @api.model
+    def _auto_cancel_use_jobs(self):
+        """ Whether the automatic cancellation of more sales orders than
+        the chunk size is delegated to jobs """
+        params = self.env['ir.config_parameter'].sudo()
+        return params.get_param('connector_ecommerce.auto_cancel_in_jobs',
+                                default='False') in ('1', 'True', 'true')
+
+    @api.multi
+    def _auto_cancel(self):
+        """ Try to automatically cancel the sales orders canceled in a
+        backend
+
+        When the orders are more than the chunk size and the jobs are
+        enabled (parameter ``connector_ecommerce.auto_cancel_in_jobs``),
+        each chunk is canceled in a job, so the locks are held only for
+        the duration of a chunk. Otherwise, they are canceled in the
+        current transaction.
+
+        :return: the outcomes of ``_try_auto_cancel``, empty when the
+                 cancellation is delegated to jobs
+        """
+        chunk_size = self._auto_cancel_chunk_size()
+        if len(self) > chunk_size and self._auto_cancel_use_jobs():
+            session = ConnectorSession.from_env(self.env)
+            for index in xrange(0, len(self), chunk_size):
+                chunk = self[index:index + chunk_size]
+                auto_cancel_sale_orders.delay(
+                    session, self._name, chunk.ids,
+                    description='Automatic cancellation of %d sales orders '
+                                'canceled on the backend' % len(chunk),
+                )
+            return {}
+        return self._try_auto_cancel()
 
     @api.multi
     def _try_auto_cancel(self):
@@ -100,50 +253,92 @@ class SaleOrder(models.Model):
         in a backend.
 
         If it can't cancel it, does nothing.
+
+        Each order is canceled in its own savepoint: when the
+        cancellation of an order fails, only this order is rolled back
+        and the others are still canceled. The orders are processed by
+        chunks, the messages of a chunk are posted together. The
+        concurrency errors are raised so the job or request is retried.
+
+        :return: {order id: outcome}, the outcome being one of
+                 'already_canceled', 'done' (cannot be canceled),
+                 'canceled' or 'failed'
         """
         resolution_msg = _("<p>Resolution:<ol>"
                            "<li>Cancel the linked invoices, delivery "
                            "orders, automatic payments.</li>"
                            "<li>Cancel the sales order manually.</li>"
                            "</ol></p>")
-        for order in self:
-            state = order.state
-            if state == 'cancel':
-                continue
-            elif state == 'done':
-                message = _('The sales order cannot be automatically '
-                            'canceled because it is already in "Done" state.')
-            else:
-                try:
-                    order.action_cancel()
-                except (osv.osv.except_osv, osv.orm.except_orm,
-                        exceptions.Warning):
-                    # the 'cancellation_resolved' flag will stay to False
-                    message = _("The sales order could not be automatically "
-                                "canceled.") + resolution_msg
+        outcomes = {}
+        chunk_size = self._auto_cancel_chunk_size()
+        for index in xrange(0, len(self), chunk_size):
+            messages = []
+            for order in self[index:index + chunk_size]:
+                state = order.state
+                if state == 'cancel':
+                    outcomes[order.id] = 'already_canceled'
+                    continue
+                elif state == 'done':
+                    outcome = 'done'
+                    message = _('The sales order cannot be automatically '
+                                'canceled because it is already in "Done" '
+                                'state.')
                 else:
-                    message = _("The sales order has been automatically "
-                                "canceled.")
-            order.message_post(body=message)
+                    outcome = order._try_cancel_one()
+                    if outcome == 'failed':
+                        # the 'cancellation_resolved' flag will stay to False
+                        message = _("The sales order could not be "
+                                    "automatically canceled.") + resolution_msg
+                    else:
+                        message = _("The sales order has been automatically "
+                                    "canceled.")
+                outcomes[order.id] = outcome
+                messages.append((order, message))
+            message_post_bulk(self.env, messages)
+        return outcomes
+
+    @api.multi
+    def _try_cancel_one(self):
+        """ Cancel one sales order in a savepoint
+
+        :return: 'canceled' or 'failed'
+        """
+        self.ensure_one()
+        try:
+            with self.env.cr.savepoint():
+                self.action_cancel()
+        except (psycopg2.OperationalError, RetryableJobError):
+            # concurrency errors are transient: the job or the request
+            # is retried instead of reporting a failed cancellation
+            raise
+        except (osv.osv.except_osv, osv.orm.except_orm,
+                exceptions.Warning):
+            self.env.invalidate_all()
+            return 'failed'
+        except Exception:
+            _logger.exception('Unexpected error when canceling the sales '
+                              'order %s', self.name)
+            self.env.invalidate_all()
+            return 'failed'
+        return 'canceled'
 
     @api.multi
     def _log_canceled_in_backend(self):
         message = _("The sales order has been canceled on the backend.")
-        self.message_post(body=message)
+        messages = [(order, message) for order in self]
         for order in self:
             message = _("Warning: the origin sales order %s has been canceled "
                         "on the backend.") % order.name
-            for picking in order.picking_ids:
-                picking.message_post(body=message)
-            for invoice in order.invoice_ids:
-                invoice.message_post(body=message)
+            messages += [(picking, message) for picking in order.picking_ids]
+            messages += [(invoice, message) for invoice in order.invoice_ids]
+        message_post_bulk(self.env, messages)
 
     @api.model
     def create(self, values):
         order = super(SaleOrder, self).create(values)
         if values.get('canceled_in_backend'):
             order._log_canceled_in_backend()
-            order._try_auto_cancel()
+            order._auto_cancel()
         return order
 
     @api.multi
@@ -151,9 +346,15 @@ class SaleOrder(models.Model):
         result = super(SaleOrder, self).write(values)
         if values.get('canceled_in_backend'):
             self._log_canceled_in_backend()
-            self._try_auto_cancel()
+            self._auto_cancel()
         return result
 
+    @api.multi
+    def _get_bound_backends(self):
+        """ Return {order id: set of (backend model, backend id)} of the
+        orders having a binding """
+        return get_bound_backends(self.env, self._name, self.ids)
+
     @api.multi
     def action_cancel(self):
         res = super(SaleOrder, self).action_cancel()
@@ -174,7 +375,7 @@ class SaleOrder(models.Model):
         message = (_("Despite the cancellation of the sales order on the "
                      "backend, it should stay open.<br/><br/>Reason: %s") %
                    reason)
-        self.message_post(body=message)
+        message_post_bulk(self.env, [(order, message) for order in self])
         self.write({'cancellation_resolved': True})
         return True
 
@@ -199,3 +400,22 @@ class SaleOrder(models.Model):
         action['views'] = [(view.id if view else False, 'form')]
         action['res_id'] = parent.id
         return action
+
+
+@job
+def auto_cancel_sale_orders(session, model_name, order_ids):
+    """ Try to automatically cancel sales orders canceled in a backend """
+    orders = session.env[model_name].browse(order_ids).exists()
+    outcomes = orders._try_auto_cancel()
+    summary = defaultdict(int)
+    for outcome in outcomes.itervalues():
+        summary[outcome] += 1
+    return ', '.join('%s: %d' % (outcome, count)
+                     for outcome, count in sorted(summary.iteritems()))
+
+
+@job
+def ignore_cancellation_sale_orders(session, model_name, order_ids, reason):
+    """ Set the cancellation from the backend as resolved """
+    orders = session.env[model_name].browse(order_ids).exists()
+    orders.ignore_cancellation(reason)
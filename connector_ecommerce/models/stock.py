@@ -4,8 +4,11 @@
 
 from openerp import models, fields, api
 
-from openerp.addons.connector.session import ConnectorSession
-from .event import on_picking_out_done, on_tracking_number_added
+from .event import (on_picking_out_done,
+                    on_picking_out_done_batch,
+                    on_tracking_number_added,
+                    fire_event)
+from .binding import get_bound_backends, filter_bound
 
 
 class StockPicking(models.Model):
@@ -17,32 +20,73 @@ class StockPicking(models.Model):
         string="Related backorders",
     )
 
+    @api.multi
+    def _get_bound_backends(self):
+        """ Return {picking id: set of (backend model, backend id)} of
+        the pickings having a binding or coming from a sales order
+        having a binding """
+        backends = get_bound_backends(self.env, self._name, self.ids)
+        sale_backends = self.mapped('sale_id')._get_bound_backends()
+        for picking in self:
+            if picking.sale_id.id in sale_backends:
+                backends[picking.id] |= sale_backends[picking.sale_id.id]
+        return backends
+
     @api.multi
     def write(self, vals):
         res = super(StockPicking, self).write(vals)
         if vals.get('carrier_tracking_ref'):
-            session = ConnectorSession.from_env(self.env)
-            for record_id in self.ids:
-                on_tracking_number_added.fire(session, self._name, record_id)
+            for record_id in filter_bound(self).ids:
+                fire_event(self.env, on_tracking_number_added,
+                           self._name, record_id)
         return res
 
+    @api.multi
+    def _get_outgoing_pickings(self):
+        """ Return the outgoing pickings among the pickings
+
+        The picking types are prefetched for all the pickings at once.
+        """
+        return self.filtered(lambda p: p.picking_type_id.code == 'outgoing')
+
+    @api.multi
+    def _get_backordered_ids(self):
+        """ Return the ids of the pickings which have backorders, in one
+        query for all the pickings """
+        if not self.ids:
+            return set()
+        groups = self.read_group([('backorder_id', 'in', self.ids)],
+                                 ['backorder_id'], ['backorder_id'])
+        return set(group['backorder_id'][0] for group in groups)
+
+    @api.model
+    def _fire_picking_out_done(self, picking_types):
+        """ Fire ``on_picking_out_done`` for each picking and
+        ``on_picking_out_done_batch`` for all of them
+
+        :param picking_types: list of (picking id, 'partial' or 'complete')
+        """
+        for picking_id, method in picking_types:
+            fire_event(self.env, on_picking_out_done, self._name,
+                       picking_id, method)
+        if picking_types:
+            fire_event(self.env, on_picking_out_done_batch, self._name,
+                       picking_types)
+
     @api.multi
     def do_transfer(self):
         # The key in the context avoid the event to be fired in
         # StockMove.action_done(). Allow to handle the partial pickings
         self_context = self.with_context(__no_on_event_out_done=True)
         result = super(StockPicking, self_context).do_transfer()
-        session = ConnectorSession.from_env(self.env)
-        for picking in self:
-            if picking.picking_type_id.code != 'outgoing':
-                continue
-            if picking.related_backorder_ids:
-                method = 'partial'
-            else:
-                method = 'complete'
-            on_picking_out_done.fire(session, 'stock.picking',
-                                     picking.id, method)
-
+        pickings = filter_bound(self._get_outgoing_pickings())
+        backordered_ids = pickings._get_backordered_ids()
+        picking_types = [
+            (picking.id,
+             'partial' if picking.id in backordered_ids else 'complete')
+            for picking in pickings
+        ]
+        self._fire_picking_out_done(picking_types)
         return result
 
 
@@ -51,22 +95,22 @@ class StockMove(models.Model):
 
     @api.multi
     def action_done(self):
-        fire_event = not self.env.context.get('__no_on_event_out_done')
-        if fire_event:
+        fire_out_done = not self.env.context.get('__no_on_event_out_done')
+        if fire_out_done:
             pickings = self.mapped('picking_id')
             states = {p.id: p.state for p in pickings}
 
         result = super(StockMove, self).action_done()
 
-        if fire_event:
-            session = ConnectorSession.from_env(self.env)
-            for picking in pickings:
-                if states[picking.id] != 'done' and picking.state == 'done':
-                    if picking.picking_type_id.code != 'outgoing':
-                        continue
-                    # partial pickings are handled in
-                    # StockPicking.do_transfer()
-                    on_picking_out_done.fire(session, 'stock.picking',
-                                             picking.id, 'complete')
+        if fire_out_done:
+            done = pickings.filtered(
+                lambda p: states[p.id] != 'done' and p.state == 'done'
+            )
+            # partial pickings are handled in
+            # StockPicking.do_transfer()
+            outgoing = filter_bound(done._get_outgoing_pickings())
+            picking_types = [(picking.id, 'complete')
+                             for picking in outgoing]
+            pickings._fire_picking_out_done(picking_types)
 
         return result
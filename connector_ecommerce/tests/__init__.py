@@ -3,3 +3,13 @@
 from . import test_onchange
 from . import test_invoice_event
 from . import test_picking_event
+from . import test_line_builder
+from . import test_account_tax
+from . import test_payment_mode
+from . import test_product
+from . import test_event_buffer
+from . import test_event_outbox
+from . import test_event_stats
+from . import test_binding
+from . import test_change_feed
+from . import test_sale
@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+# © 2016 Camptocamp SA
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html)
+
+from openerp import exceptions
+import openerp.tests.common as common
+
+
+class TestTaxFromRate(common.TransactionCase):
+    """ Test the search of the sale taxes by rate """
+
+    def setUp(self):
+        super(TestTaxFromRate, self).setUp()
+        self.tax_model = self.env['account.tax']
+        self.tax_model.search([]).write({'active': False})
+        self.tax_8 = self.tax_model.create({'name': 'Tax 8.0',
+                                            'amount': 8.0,
+                                            'type_tax_use': 'sale'})
+        self.tax_8_incl = self.tax_model.create({'name': 'Tax 8.0 incl.',
+                                                 'amount': 8.0,
+                                                 'price_include': True,
+                                                 'type_tax_use': 'sale'})
+        self.tax_2_5 = self.tax_model.create({'name': 'Tax 2.5',
+                                              'amount': 2.5,
+                                              'type_tax_use': 'sale'})
+        self.tax_model.create({'name': 'Purchase Tax 3.0',
+                               'amount': 3.0,
+                               'type_tax_use': 'purchase'})
+
+    def test_get_tax_from_rate(self):
+        """ Find the tax with the nearest rate """
+        get_tax = self.tax_model.get_tax_from_rate
+        self.assertEqual(get_tax(8.0), self.tax_8)
+        self.assertEqual(get_tax(8.0, is_tax_included=True),
+                         self.tax_8_incl)
+        self.assertEqual(get_tax(2.5005), self.tax_2_5)
+        # less precision
+        self.assertEqual(get_tax(2.509), self.tax_2_5)
+        self.assertFalse(get_tax(2.52))
+        # purchase taxes are ignored
+        self.assertFalse(get_tax(3.0))
+
+    def test_get_taxes_from_rates(self):
+        """ Find the taxes of many rates """
+        taxes = self.tax_model.get_taxes_from_rates(
+            [(8.0, False), (8.0, True), (2.5, True), (2.5, False)]
+        )
+        self.assertEqual(taxes, [self.tax_8, self.tax_8_incl,
+                                 self.tax_model.browse(), self.tax_2_5])
+
+    def test_index_updated(self):
+        """ The index is updated when the taxes are modified """
+        get_tax = self.tax_model.get_tax_from_rate
+        self.assertFalse(get_tax(7.7))
+        self.tax_8.amount = 7.7
+        self.assertEqual(get_tax(7.7), self.tax_8)
+        tax_20 = self.tax_model.create({'name': 'Tax 20.0',
+                                        'amount': 20.0,
+                                        'type_tax_use': 'sale'})
+        self.assertEqual(get_tax(20.0), tax_20)
+        tax_20.unlink()
+        self.assertFalse(get_tax(20.0))
+
+
+class TestTaxGroup(common.TransactionCase):
+    """ Test the tax group of the products """
+
+    def setUp(self):
+        super(TestTaxGroup, self).setUp()
+        tax_model = self.env['account.tax']
+        group_model = self.env['account.tax.group']
+        self.group_a = group_model.create({'name': 'Group A'})
+        self.group_b = group_model.create({'name': 'Group B'})
+        self.tax_a = tax_model.create({'name': 'Tax A',
+                                       'amount': 8.0,
+                                       'type_tax_use': 'sale',
+                                       'tax_group_id': self.group_a.id})
+        self.tax_b = tax_model.create({'name': 'Tax B',
+                                       'amount': 2.5,
+                                       'type_tax_use': 'sale',
+                                       'tax_group_id': self.group_b.id})
+        template_model = self.env['product.template']
+        self.templates = template_model.browse()
+        for taxes in (self.tax_a, self.tax_a | self.tax_b, self.tax_b):
+            self.templates |= template_model.create({
+                'name': 'Product',
+                'taxes_id': [(6, 0, taxes.ids)],
+            })
+
+    def test_compute_tax_group(self):
+        """ The group is empty when the taxes have different groups """
+        self.assertEqual(self.templates.mapped('tax_group_id'),
+                         self.group_a | self.group_b)
+        self.assertEqual(self.templates[0].tax_group_id, self.group_a)
+        self.assertFalse(self.templates[1].tax_group_id)
+        self.assertEqual(self.templates[2].tax_group_id, self.group_b)
+
+    def test_inverse_tax_group(self):
+        """ Setting the group replaces the taxes by a tax of the group """
+        self.templates.write({'tax_group_id': self.group_b.id})
+        for template in self.templates:
+            self.assertEqual(template.taxes_id, self.tax_b)
+            self.assertEqual(template.tax_group_id, self.group_b)
+
+    def test_inverse_tax_group_keep_taxes(self):
+        """ The taxes already in the group are kept """
+        tax_a_incl = self.env['account.tax'].create({
+            'name': 'Tax A incl.',
+            'amount': 8.0,
+            'price_include': True,
+            'type_tax_use': 'sale',
+            'tax_group_id': self.group_a.id,
+        })
+        self.templates[0].taxes_id = tax_a_incl
+        self.templates[1].taxes_id = tax_a_incl | self.tax_b
+        self.templates.write({'tax_group_id': self.group_a.id})
+        self.assertEqual(self.templates[0].taxes_id, tax_a_incl)
+        self.assertEqual(self.templates[1].taxes_id, tax_a_incl)
+        self.assertEqual(self.templates[2].taxes_id, self.tax_a)
+        self.assertEqual(self.templates.mapped('tax_group_id'),
+                         self.group_a)
+
+    def test_inverse_tax_group_empty(self):
+        """ Emptying the group leaves the taxes untouched """
+        taxes = [template.taxes_id for template in self.templates]
+        self.templates.write({'tax_group_id': False})
+        for template, template_taxes in zip(self.templates, taxes):
+            self.assertEqual(template.taxes_id, template_taxes)
+
+    def test_inverse_tax_group_no_sale_tax(self):
+        """ A group without sale tax for the company is refused """
+        group_c = self.env['account.tax.group'].create({'name': 'Group C'})
+        self.env['account.tax'].create({'name': 'Purchase Tax C',
+                                        'amount': 3.0,
+                                        'type_tax_use': 'purchase',
+                                        'tax_group_id': group_c.id})
+        with self.assertRaises(exceptions.UserError):
+            self.templates[0].tax_group_id = group_c
+        self.assertEqual(self.templates[0].taxes_id, self.tax_a)
@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+# © 2016 Camptocamp SA
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html)
+
+from openerp.addons.connector_ecommerce.models import binding
+from openerp.addons.connector_ecommerce.models.binding import (
+    filter_bound, get_binding_models, get_bound_backends)
+import openerp.tests.common as common
+
+
+class TestBinding(common.TransactionCase):
+    """ Test the lookup of the bindings of the records """
+
+    def test_binding_models(self):
+        """ Only the models with a backend are binding models """
+        # res.users _inherits res.partner but has no backend_id
+        self.assertNotIn(('res.users', 'partner_id'),
+                         get_binding_models(self.env, 'res.partner'))
+
+    def test_binding_models_cache(self):
+        """ The binding models are kept per database and registry """
+        bindings = get_binding_models(self.env, 'product.product')
+        registry_ref, by_model = binding._binding_models[
+            self.env.registry.db_name
+        ]
+        self.assertIs(registry_ref(), self.env.registry)
+        self.assertEqual(by_model['product.product'], bindings)
+
+    def test_no_binding(self):
+        """ The records without binding are filtered only when asked """
+        products = self.env['product.product'].search([], limit=3)
+        self.assertFalse(get_bound_backends(self.env, 'product.product',
+                                            products.ids))
+        self.assertEqual(filter_bound(products), products)
+        self.env['ir.config_parameter'].set_param(
+            'connector_ecommerce.skip_unbound_records', 'True')
+        self.assertFalse(filter_bound(products))
@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+# © 2016 Camptocamp SA
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html)
+
+import mock
+
+from openerp.addons.connector_ecommerce.models.event import (
+    fire_event, outbox_events, register_outbox_event)
+import openerp.tests.common as common
+
+
+class TestChangeFeed(common.TransactionCase):
+    """ Test the pagination of the change feed """
+
+    def setUp(self):
+        super(TestChangeFeed, self).setUp()
+        self.feed_model = self.env['connector.change.feed']
+        self.event = mock.Mock()
+        register_outbox_event('on_test_event', self.event)
+        self.addCleanup(outbox_events.pop, 'on_test_event')
+        self.env['ir.config_parameter'].set_param(
+            'connector_ecommerce.change_feed', 'True')
+        # the changes of the running transaction are not visible in the
+        # feed, make them visible for the test
+        self.env.cr.execute("SELECT txid_current()")
+        visible_txid = self.env.cr.fetchone()[0] + 1
+        patcher = mock.patch.object(type(self.feed_model),
+                                    '_get_visible_txid',
+                                    return_value=visible_txid)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_read_changes(self):
+        """ The changes are read by pages after a cursor """
+        for record_id in (1, 2, 3):
+            fire_event(self.env, self.event, 'stock.picking', record_id)
+        # the batch events are not in the feed
+        fire_event(self.env, self.event, 'stock.picking', [1, 2, 3])
+        self.assertEqual(self.event.fire.call_count, 4)
+
+        page = self.feed_model.read_changes(limit=2,
+                                            model_name='stock.picking')
+        self.assertEqual([change['id'] for change in page['changes']],
+                         [1, 2])
+        self.assertEqual(page['changes'][0]['kind'], 'test_event')
+        page = self.feed_model.read_changes(cursor=page['cursor'],
+                                            model_name='stock.picking')
+        self.assertEqual([change['id'] for change in page['changes']],
+                         [3])
+        cursor = page['cursor']
+        page = self.feed_model.read_changes(cursor=cursor,
+                                            model_name='stock.picking')
+        self.assertFalse(page['changes'])
+        self.assertEqual(page['cursor'], cursor)
+
+    def test_running_transaction_not_visible(self):
+        """ The changes of the running transactions are not read """
+        fire_event(self.env, self.event, 'stock.picking', 1)
+        self.assertTrue(self.feed_model.read_changes()['changes'])
+        type(self.feed_model)._get_visible_txid.return_value = 0
+        self.assertFalse(self.feed_model.read_changes()['changes'])
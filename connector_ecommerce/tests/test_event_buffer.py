@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+# © 2016 Camptocamp SA
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html)
+
+import mock
+
+from openerp.addons.connector_ecommerce.models.event import (
+    fire_event, get_event_buffer)
+import openerp.tests.common as common
+
+
+class TestEventBuffer(common.TransactionCase):
+    """ Test the coalescing of the events until the commit """
+
+    def setUp(self):
+        super(TestEventBuffer, self).setUp()
+        self.event = mock.Mock()
+        self.coalesce_env = self.env(
+            context=dict(self.env.context, connector_coalesce_events=True)
+        )
+
+    def test_fire_immediately(self):
+        """ Without the context key, the listeners are called at once """
+        fire_event(self.env, self.event, 'stock.picking', 1)
+        self.event.fire.assert_called_once_with(mock.ANY, 'stock.picking', 1)
+
+    def test_coalesce(self):
+        """ The duplicated events are dispatched once """
+        env = self.coalesce_env
+        fire_event(env, self.event, 'stock.picking', 1)
+        fire_event(env, self.event, 'stock.picking', 1)
+        fire_event(env, self.event, 'stock.picking', 2)
+        fire_event(env, self.event, 'product.product', [1, 2])
+        fire_event(env, self.event, 'product.product', [1, 2])
+        self.assertFalse(self.event.fire.called)
+
+        event_buffer = get_event_buffer(self.env.cr)
+        event_buffer.dispatch(self.env)
+        self.assertEqual(
+            self.event.fire.call_args_list,
+            [mock.call(mock.ANY, 'stock.picking', 1),
+             mock.call(mock.ANY, 'stock.picking', 2),
+             mock.call(mock.ANY, 'product.product', [1, 2])]
+        )
+
+    def test_dispatch_failure(self):
+        """ A failing listener drops only the work of its own event """
+        env = self.coalesce_env
+        partner_model = self.env['res.partner']
+
+        def fire(session, model_name, record_id):
+            partner_model.create({'name': 'Partner %d' % record_id})
+            if record_id == 2:
+                raise ValueError('Boom')
+
+        self.event.fire.side_effect = fire
+        for record_id in (1, 2, 3):
+            fire_event(env, self.event, 'stock.picking', record_id)
+
+        event_buffer = get_event_buffer(self.env.cr)
+        event_buffer.dispatch(self.env)
+        self.assertEqual(self.event.fire.call_count, 3)
+        names = partner_model.search(
+            [('name', 'in', ['Partner 1', 'Partner 2', 'Partner 3'])]
+        ).mapped('name')
+        self.assertEqual(sorted(names), ['Partner 1', 'Partner 3'])
+
+    def test_rollback(self):
+        """ The events are dropped when the transaction is rolled back """
+        fire_event(self.coalesce_env, self.event, 'stock.picking', 1)
+        event_buffer = get_event_buffer(self.env.cr)
+        event_buffer.clear()
+        self.assertFalse(event_buffer.events)
+        self.assertIsNot(get_event_buffer(self.env.cr), event_buffer)
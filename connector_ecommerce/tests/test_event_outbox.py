@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+# © 2016 Camptocamp SA
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html)
+
+import mock
+
+from openerp.addons.connector_ecommerce.models.event import (
+    fire_event, outbox_events, register_outbox_event)
+import openerp.tests.common as common
+
+
+class TestEventOutbox(common.TransactionCase):
+    """ Test the storage of the events in the outbox """
+
+    def setUp(self):
+        super(TestEventOutbox, self).setUp()
+        self.outbox_model = self.env['connector.event.outbox']
+        self.event = mock.Mock()
+        register_outbox_event('test_event', self.event)
+        self.addCleanup(outbox_events.pop, 'test_event')
+        self.outbox_env = self.env(
+            context=dict(self.env.context, connector_event_outbox=True)
+        )
+
+    def test_disabled(self):
+        """ Without the outbox, the listeners are called at once """
+        fire_event(self.env, self.event, 'stock.picking', 1)
+        self.event.fire.assert_called_once_with(mock.ANY, 'stock.picking', 1)
+        self.assertFalse(self.outbox_model.search([]))
+
+    def test_enqueue_and_dispatch(self):
+        """ The events are stored then dispatched in order """
+        fire_event(self.outbox_env, self.event, 'stock.picking', 1, 'partial')
+        fire_event(self.outbox_env, self.event, 'stock.picking', [1, 2])
+        self.assertFalse(self.event.fire.called)
+        events = self.outbox_model.search([('event_name', '=', 'test_event')])
+        self.assertEqual(events.mapped('res_id'), [1, 0])
+
+        self.outbox_model._dispatch_batch(0, set())
+        self.assertEqual(
+            self.event.fire.call_args_list,
+            [mock.call(mock.ANY, 'stock.picking', 1, 'partial'),
+             mock.call(mock.ANY, 'stock.picking', [1, 2])]
+        )
+        self.assertFalse(events.exists())
+
+    def test_failure_keeps_order(self):
+        """ The next events of a record wait for its failed event """
+        for record_id in (1, 1, 2):
+            fire_event(self.outbox_env, self.event, 'stock.picking',
+                       record_id)
+        self.event.fire.side_effect = [Exception('Boom'), None]
+        self.outbox_model._dispatch_batch(0, set())
+        self.assertEqual(
+            self.event.fire.call_args_list,
+            [mock.call(mock.ANY, 'stock.picking', 1),
+             mock.call(mock.ANY, 'stock.picking', 2)]
+        )
+        events = self.outbox_model.search([('event_name', '=', 'test_event')])
+        self.assertEqual(events.mapped('res_id'), [1, 1])
+        self.assertEqual(events.mapped('attempts'), [1, 0])
+        self.assertTrue(events[0].error)
+
+    def test_dispatch_in_job(self):
+        """ One job per transaction dispatches the outbox """
+        job_model = self.env['queue.job']
+        domain = [('model_name', '=', 'connector.event.outbox')]
+        job_count = job_model.search_count(domain)
+        fire_event(self.outbox_env, self.event, 'stock.picking', 1)
+        fire_event(self.outbox_env, self.event, 'stock.picking', 2)
+        self.assertEqual(job_model.search_count(domain), job_count + 1)
+
+    def test_dispatch_inline(self):
+        """ No job is created when the dispatch is inline """
+        self.env['ir.config_parameter'].set_param(
+            'connector_ecommerce.event_outbox_inline_dispatch', 'True')
+        job_model = self.env['queue.job']
+        domain = [('model_name', '=', 'connector.event.outbox')]
+        job_count = job_model.search_count(domain)
+        fire_event(self.outbox_env, self.event, 'stock.picking', 1)
+        self.assertEqual(job_model.search_count(domain), job_count)
+
+    def test_disabled_no_query(self):
+        """ The flag of the outbox is not read on each event """
+        self.assertFalse(self.outbox_model._is_enabled())
+        query_count = self.cr.sql_log_count
+        for __ in range(10):
+            self.assertFalse(self.outbox_model._is_enabled())
+            self.assertFalse(self.outbox_model._dispatch_inline())
+        self.assertEqual(self.cr.sql_log_count, query_count)
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+# © 2016 Camptocamp SA
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html)
+
+from openerp.addons.connector.event import Event
+from openerp.addons.connector_ecommerce.models.event import (
+    dispatch_event, event_stats, fire_event, outbox_events,
+    register_outbox_event)
+import openerp.tests.common as common
+
+
+def listener_ok(session, model_name, record_id):
+    pass
+
+
+def listener_fail(session, model_name, record_id):
+    raise ValueError('Boom')
+
+
+class TestEventStats(common.TransactionCase):
+    """ Test the statistics of the dispatch of the events """
+
+    def setUp(self):
+        super(TestEventStats, self).setUp()
+        self.event = Event()
+        register_outbox_event('test_event', self.event)
+        self.addCleanup(outbox_events.pop, 'test_event')
+        event_stats.reset()
+        self.addCleanup(event_stats.reset)
+        self.stats_model = self.env['connector.event.stats']
+
+    def test_stats(self):
+        """ The fires and the calls of the listeners are counted """
+        self.event.subscribe(listener_ok)
+        fire_event(self.env, self.event, 'stock.picking', 1)
+        fire_event(self.env, self.event, 'stock.picking', 2)
+        stats = self.stats_model.get_stats()
+        event = stats['events']['test_event']
+        self.assertEqual(event['count'], 2)
+        self.assertEqual(event['listener_calls'], 2)
+        self.assertEqual(sum(event['histogram']), 2)
+        listener, = stats['listeners']
+        self.assertEqual(listener['event'], 'test_event')
+        self.assertTrue(listener['listener'].endswith('.listener_ok'))
+        self.assertEqual(listener['count'], 2)
+        self.assertEqual(listener['errors'], 0)
+
+    def test_stats_error(self):
+        """ The failures of the listeners are counted """
+        self.event.subscribe(listener_fail)
+        with self.assertRaises(ValueError):
+            fire_event(self.env, self.event, 'stock.picking', 1)
+        stats = self.stats_model.get_stats()
+        self.assertEqual(stats['events']['test_event']['count'], 1)
+        self.assertEqual(stats['listeners'][0]['errors'], 1)
+
+    def test_stats_no_query(self):
+        """ The flag of the statistics is not read on each event """
+        self.event.subscribe(listener_ok)
+        dispatch_event(self.env, self.event, 'stock.picking', (1,))
+        query_count = self.cr.sql_log_count
+        for record_id in range(2, 12):
+            dispatch_event(self.env, self.event, 'stock.picking',
+                           (record_id,))
+        self.assertEqual(self.cr.sql_log_count, query_count)
+        stats = self.stats_model.get_stats()
+        self.assertEqual(stats['events']['test_event']['count'], 11)
+
+    def test_stats_disabled(self):
+        """ The flag is read again when the parameter is modified """
+        self.event.subscribe(listener_ok)
+        dispatch_event(self.env, self.event, 'stock.picking', (1,))
+        self.env['ir.config_parameter'].set_param(
+            'connector_ecommerce.event_stats', 'False')
+        dispatch_event(self.env, self.event, 'stock.picking', (2,))
+        stats = self.stats_model.get_stats()
+        self.assertEqual(stats['events']['test_event']['count'], 1)
+
+    def test_fire_event_no_query(self):
+        """ The flags of the feed, the outbox and the statistics are not
+        read on each event """
+        self.event.subscribe(listener_ok)
+        fire_event(self.env, self.event, 'stock.picking', 1)
+        query_count = self.cr.sql_log_count
+        for record_id in range(2, 12):
+            fire_event(self.env, self.event, 'stock.picking', record_id)
+        self.assertEqual(self.cr.sql_log_count, query_count)
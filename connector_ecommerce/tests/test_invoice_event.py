@@ -70,3 +70,29 @@ class TestInvoiceEvent(common.TransactionCase):
             event_mock.fire.assert_called_with(mock.ANY,
                                                'account.invoice',
                                                self.invoice.id)
+
+    def test_event_validated_batch(self):
+        """ Test if the ``on_invoice_validated_batch`` event is fired
+        once for all the invoices validated together """
+        invoices = self.invoice | self.invoice.copy()
+        event = ('openerp.addons.connector_ecommerce.'
+                 'models.invoice.on_invoice_validated_batch')
+        with mock.patch(event) as event_mock:
+            invoices.invoice_validate()
+            event_mock.fire.assert_called_once_with(mock.ANY,
+                                                    'account.invoice',
+                                                    invoices.ids)
+
+    def test_event_paid_batch(self):
+        """ Test if the ``on_invoice_paid_batch`` event is fired
+        once for all the invoices paid together """
+        invoices = self.invoice | self.invoice.copy()
+        invoices.signal_workflow('invoice_open')
+        event = ('openerp.addons.connector_ecommerce.'
+                 'models.invoice.on_invoice_paid_batch')
+        with mock.patch(event) as event_mock:
+            invoices.confirm_paid()
+            self.assertEqual(invoices.mapped('state'), ['paid', 'paid'])
+            event_mock.fire.assert_called_once_with(mock.ANY,
+                                                    'account.invoice',
+                                                    invoices.ids)
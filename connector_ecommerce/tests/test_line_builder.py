@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+# © 2016 Camptocamp SA
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html)
+
+import mock
+
+from openerp.addons.connector_ecommerce.unit.line_builder import (
+    ShippingLineBuilder, GiftOrderLineBuilder)
+from openerp.addons.connector.session import ConnectorSession
+from openerp.addons.connector.connector import ConnectorEnvironment
+import openerp.tests.common as common
+
+
+class TestLineBuilder(common.TransactionCase):
+    """ Test the builders of special sales order lines """
+
+    def setUp(self):
+        super(TestLineBuilder, self).setUp()
+        session = ConnectorSession.from_env(self.env)
+        self.connector_env = ConnectorEnvironment(mock.Mock(), session,
+                                                  'sale.order.line')
+        self.shipping_product = self.env.ref(
+            'connector_ecommerce.product_product_shipping'
+        )
+
+    def test_get_line(self):
+        """ Build a shipping line """
+        builder = ShippingLineBuilder(self.connector_env)
+        builder.price_unit = 10
+        line = builder.get_line()
+        self.assertEqual(line, {
+            'product_id': self.shipping_product.id,
+            'name': self.shipping_product.name,
+            'product_uom': self.shipping_product.uom_id.id,
+            'product_uom_qty': 1,
+            'price_unit': 10,
+            'sequence': 999,
+        })
+
+    def test_get_line_product_renamed(self):
+        """ The cached product is refreshed when it is modified """
+        builder = ShippingLineBuilder(self.connector_env)
+        builder.price_unit = 10
+        self.assertEqual(builder.get_line()['name'],
+                         self.shipping_product.name)
+        self.shipping_product.name = 'Delivery'
+        self.assertEqual(builder.get_line()['name'], 'Delivery')
+        self.shipping_product.product_tmpl_id.name = 'Transport'
+        self.assertEqual(builder.get_line()['name'], 'Transport')
+
+    def test_get_lines(self):
+        """ Build gift lines for many sales orders """
+        builder = GiftOrderLineBuilder(self.connector_env)
+        lines = builder.get_lines([
+            {'price_unit': 10, 'gift_code': 'A'},
+            {'price_unit': 20, 'quantity': 2},
+        ])
+        self.assertEqual(len(lines), 2)
+        self.assertEqual(lines[0]['price_unit'], -10)
+        self.assertTrue(lines[0]['name'].endswith('[A]'))
+        self.assertEqual(lines[1]['price_unit'], -20)
+        self.assertEqual(lines[1]['product_uom_qty'], 2)
+        self.assertNotIn('[A]', lines[1]['name'])
+        # the builder is left untouched
+        self.assertIsNone(builder.price_unit)
+        self.assertIsNone(builder.gift_code)
+
+    def test_special_line_cache_imported_product(self):
+        """ Renaming an imported product does not clear the caches """
+        product = self.env['product.product'].create({'name': 'Imported'})
+        self.env['ir.model.data'].create({
+            'module': '__export__',
+            'name': 'product_product_imported',
+            'model': 'product.product',
+            'res_id': product.id,
+        })
+        product_model = type(self.env['product.product'])
+        with mock.patch.object(product_model, 'clear_caches') as clear_mock:
+            product.name = 'Renamed'
+            self.assertFalse(clear_mock.called)
+            self.shipping_product.name = 'Delivery'
+            self.assertTrue(clear_mock.called)
+
+    def test_special_line_cache_unlink(self):
+        """ The cache is cleared when a special product is deleted """
+        builder = ShippingLineBuilder(self.connector_env)
+        builder.price_unit = 10
+        builder.get_line()
+        product_model = type(self.env['product.product'])
+        with mock.patch.object(product_model, 'clear_caches') as clear_mock:
+            self.shipping_product._clear_special_line_cache()
+            self.assertTrue(clear_mock.called)
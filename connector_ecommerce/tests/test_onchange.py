@@ -86,3 +86,152 @@ class TestOnchange(common.TransactionCase):
         self.assertEqual(line['name'], 'Line 2')
         self.assertEqual(line['product_uom'], product.uom_id.id)
         self.assertEqual(line['tax_id'], [(5,), (4, tax.id)])
+
+    def test_onchange_template_cache(self):
+        """ The onchange specs and blank values are cached per model """
+        backend_record = mock.Mock()
+        env = ConnectorEnvironment(backend_record, self.session, 'sale.order')
+        onchange = SaleOrderOnChange(env)
+        model = self.env['sale.order.line']
+        specs, blank_values = onchange._get_onchange_template(model)
+        self.assertEqual(specs, model._onchange_spec())
+        self.assertEqual(set(blank_values), set(model._fields))
+        self.assertFalse(any(blank_values.values()))
+        # same objects are returned from the cache
+        cached = onchange._get_onchange_template(model)
+        self.assertIs(cached[0], specs)
+        self.assertIs(cached[1], blank_values)
+        # clearing the caches drops them
+        model.clear_caches()
+        self.assertIsNot(onchange._get_onchange_template(model)[0], specs)
+
+    def test_play_onchange_line_cache(self):
+        """ Memoized line onchanges give the same result as the onchanges """
+        backend_record = mock.Mock()
+        env = ConnectorEnvironment(backend_record, self.session, 'sale.order')
+        partner = self.env['res.partner'].create({'name': 'seb'})
+        product = self.env['product.product'].create({'name': 'My Product'})
+        other_product = self.env['product.product'].create(
+            {'name': 'Other Product'}
+        )
+
+        def order_vals():
+            lines = [(0, 0, {'product_id': prod.id,
+                             'price_unit': 10,
+                             'product_uom_qty': 2})
+                     for prod in (product, other_product, product, product)]
+            return {'partner_id': partner.id, 'order_line': lines}
+
+        expected = SaleOrderOnChange(env).play(order_vals(), [])
+
+        onchange = SaleOrderOnChange(env)
+        onchange.line_onchange_cache_size = 10
+        with mock.patch.object(onchange, 'play_onchanges',
+                               wraps=onchange.play_onchanges) as play:
+            order = onchange.play(order_vals(), [])
+            # 1 for the order, 1 for each distinct product
+            self.assertEqual(play.call_count, 3)
+        self.assertEqual(order, expected)
+        # the memoized values are not shared between the lines
+        self.assertIsNot(order['order_line'][2][2],
+                         order['order_line'][3][2])
+
+    def test_play_onchange_line_cache_prices(self):
+        """ The lines of the same product with other prices are not
+        memoized together """
+        backend_record = mock.Mock()
+        env = ConnectorEnvironment(backend_record, self.session, 'sale.order')
+        partner = self.env['res.partner'].create({'name': 'seb'})
+        product = self.env['product.product'].create({'name': 'My Product'})
+        prices = [(10, 0), (20, 0), (10, 50), (10, 0)]
+
+        def order_vals():
+            lines = [(0, 0, {'product_id': product.id,
+                             'price_unit': price_unit,
+                             'discount': discount,
+                             'product_uom_qty': 2})
+                     for price_unit, discount in prices]
+            return {'partner_id': partner.id, 'order_line': lines}
+
+        expected = SaleOrderOnChange(env).play(order_vals(), [])
+
+        onchange = SaleOrderOnChange(env)
+        onchange.line_onchange_cache_size = 10
+        with mock.patch.object(onchange, 'play_onchanges',
+                               wraps=onchange.play_onchanges) as play:
+            order = onchange.play(order_vals(), [])
+            # 1 for the order, 1 for each distinct line
+            self.assertEqual(play.call_count, 4)
+        self.assertEqual(order, expected)
+
+    def test_play_onchange_sparse(self):
+        """ The sparse mode gives the same result as the full mode """
+        backend_record = mock.Mock()
+        env = ConnectorEnvironment(backend_record, self.session, 'sale.order')
+        partner = self.env['res.partner'].create({'name': 'seb'})
+        self.env['res.partner'].create({'name': 'Guewen',
+                                        'type': 'delivery',
+                                        'parent_id': partner.id})
+        tax = self.env['account.tax'].create({'name': 'My Tax',
+                                              'amount': 1.0})
+        product = self.env['product.product'].create({
+            'name': 'My Product',
+            'taxes_id': [(6, 0, [tax.id])],
+        })
+        payment_mode_xmlid = 'account_payment_mode.payment_mode_inbound_ct2'
+        payment_mode = self.env.ref(payment_mode_xmlid)
+
+        def order_vals():
+            return {
+                'partner_id': partner.id,
+                'payment_mode_id': payment_mode.id,
+                'order_line': [
+                    (0, 0, {'product_id': product.id,
+                            'price_unit': 20,
+                            'product_uom_qty': 3}),
+                    (0, 0, {'product_id': product.id,
+                            'name': 'My Real Name',
+                            'price_unit': 10}),
+                ],
+            }
+
+        full = SaleOrderOnChange(env).play(order_vals(), [])
+        onchange = SaleOrderOnChange(env)
+        onchange.sparse_onchange = True
+        sparse = onchange.play(order_vals(), [])
+        self.assertEqual(sparse, full)
+
+        model = self.env['sale.order.line']
+        specs, blank_values = onchange._get_onchange_template(model,
+                                                              sparse=True)
+        self.assertLess(len(blank_values), len(model._fields))
+
+    def test_play_many(self):
+        """ Play the onchanges on a batch of sales orders """
+        backend_record = mock.Mock()
+        env = ConnectorEnvironment(backend_record, self.session, 'sale.order')
+        partners = self.env['res.partner']
+        products = self.env['product.product']
+        for index in range(3):
+            partners |= partners.create({'name': 'Partner %d' % index})
+            products |= products.create({'name': 'Product %d' % index})
+
+        def orders_vals():
+            orders = []
+            for partner in partners:
+                lines = [(0, 0, {'product_id': product.id,
+                                 'price_unit': 10,
+                                 'product_uom_qty': 1})
+                         for product in products]
+                orders.append(({'partner_id': partner.id,
+                                'order_line': lines}, []))
+            return orders
+
+        onchange = SaleOrderOnChange(env)
+        expected = [onchange.play(order, lines)
+                    for order, lines in orders_vals()]
+        self.env.invalidate_all()
+        result = SaleOrderOnChange(env).play_many(orders_vals())
+        self.assertEqual(result, expected)
+        self.assertEqual([order['partner_id'] for order in result],
+                         partners.ids)
@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+# © 2016 Camptocamp SA
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html)
+
+import openerp.tests.common as common
+
+
+class TestPaymentMode(common.TransactionCase):
+    """ Test the search of the payment methods by name """
+
+    def setUp(self):
+        super(TestPaymentMode, self).setUp()
+        self.payment_mode_model = self.env['account.payment.mode']
+        self.payment_mode = self.env.ref(
+            'account_payment_mode.payment_mode_inbound_ct2'
+        )
+
+    def test_get_payment_method(self):
+        """ Get an existing payment method, whatever its case """
+        name = ' %s ' % self.payment_mode.name.upper()
+        method = self.payment_mode_model.get_or_create_payment_method(name)
+        self.assertEqual(method, self.payment_mode)
+
+    def test_get_payment_method_renamed(self):
+        """ The cache follows the modifications of the payment modes """
+        name = self.payment_mode.name
+        get_method = self.payment_mode_model.get_or_create_payment_method
+        self.assertEqual(get_method(name), self.payment_mode)
+        self.payment_mode.name = 'Wire Transfer (renamed)'
+        self.assertEqual(get_method('wire transfer (renamed)'),
+                         self.payment_mode)
+
+    def test_get_payment_methods(self):
+        """ Get many payment methods at once """
+        name = self.payment_mode.name
+        result = self.payment_mode_model.get_or_create_payment_methods(
+            [name, name.lower()]
+        )
+        self.assertEqual(result, {name: self.payment_mode,
+                                  name.lower(): self.payment_mode})
+
+    def test_get_payment_method_imported_renamed(self):
+        """ The key of an imported payment mode follows its name """
+        self.payment_mode.write({'name': 'PayPal',
+                                 'normalized_name': 'paypal'})
+        get_method = self.payment_mode_model.get_or_create_payment_method
+        self.assertEqual(get_method('paypal'), self.payment_mode)
+        self.payment_mode.name = 'PayPal Express'
+        self.assertEqual(self.payment_mode.normalized_name, 'paypal express')
+        self.assertEqual(get_method('PayPal Express'), self.payment_mode)
+        # a new 'PayPal' payment mode can be imported again
+        paypal = self.payment_mode.copy({'name': 'PayPal',
+                                         'normalized_name': 'paypal'})
+        self.assertEqual(get_method('PayPal'), paypal)
@@ -79,3 +79,55 @@ class TestPickingEvent(common.TransactionCase):
             event_mock.fire.assert_called_with(mock.ANY,
                                                'stock.picking',
                                                self.picking.id)
+
+    def test_event_on_picking_out_done_batch(self):
+        """ Test if the ``on_picking_out_done_batch`` event is fired
+        once for all the pickings transferred together """
+        picking2 = self.picking.copy()
+        pickings = self.picking | picking2
+        pickings.action_confirm()
+        pickings.force_assign()
+        self.picking.do_prepare_partial()
+        for operation in self.picking.pack_operation_ids:
+            operation.product_qty = 1
+        event = ('openerp.addons.connector_ecommerce.models.'
+                 'stock.on_picking_out_done_batch')
+        with mock.patch(event) as event_mock:
+            pickings.do_transfer()
+            event_mock.fire.assert_called_once_with(
+                mock.ANY,
+                'stock.picking',
+                [(self.picking.id, 'partial'),
+                 (picking2.id, 'complete')],
+            )
+
+    def test_event_on_picking_out_done_unbound(self):
+        """ Test if the ``on_picking_out_done`` event is skipped for the
+        pickings without binding when they are filtered """
+        self.env['ir.config_parameter'].set_param(
+            'connector_ecommerce.skip_unbound_records', 'True')
+        self.picking.force_assign()
+        event = ('openerp.addons.connector_ecommerce.models.'
+                 'stock.on_picking_out_done')
+        with mock.patch(event) as event_mock:
+            self.picking.action_done()
+            self.assertEquals(self.picking.state, 'done')
+            self.assertFalse(event_mock.fire.called)
+
+    def test_event_on_picking_out_done_bound_sale(self):
+        """ Test if the ``on_picking_out_done`` event is fired for the
+        pickings of a sales order having a binding """
+        self.env['ir.config_parameter'].set_param(
+            'connector_ecommerce.skip_unbound_records', 'True')
+        self.picking.force_assign()
+        event = ('openerp.addons.connector_ecommerce.models.'
+                 'stock.on_picking_out_done')
+        backends = {self.sale.id: {('shop.backend', 1)}}
+        with mock.patch.object(type(self.sale_model), '_get_bound_backends',
+                               return_value=backends):
+            with mock.patch(event) as event_mock:
+                self.picking.action_done()
+                event_mock.fire.assert_called_with(mock.ANY,
+                                                   'stock.picking',
+                                                   self.picking.id,
+                                                   'complete')
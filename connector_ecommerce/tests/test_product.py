@@ -0,0 +1,218 @@
+# -*- coding: utf-8 -*-
+# © 2016 Camptocamp SA
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html)
+
+import mock
+
+import openerp.tests.common as common
+
+
+class TestProductEvent(common.TransactionCase):
+    """ Test if the events on the products are fired correctly """
+
+    def setUp(self):
+        super(TestProductEvent, self).setUp()
+        self.template = self.env['product.template'].create({
+            'name': 'T-shirt',
+            'list_price': 10,
+        })
+        self.product = self.template.product_variant_ids
+        self.product2 = self.env['product.product'].create({
+            'product_tmpl_id': self.template.id,
+        })
+        self.products = self.product | self.product2
+
+    def test_event_price_changed_template(self):
+        """ Test if the price events are fired for all the variants
+        when the price of a template is modified """
+        event = ('openerp.addons.connector_ecommerce.models.'
+                 'product.on_product_price_changed')
+        event_batch = ('openerp.addons.connector_ecommerce.models.'
+                       'product.on_product_price_changed_batch')
+        with mock.patch(event) as event_mock, \
+                mock.patch(event_batch) as event_batch_mock:
+            self.template.list_price = 20
+            event_mock.fire.assert_has_calls(
+                [mock.call(mock.ANY, 'product.product', product.id)
+                 for product in self.products],
+                any_order=True,
+            )
+            self.assertEqual(event_batch_mock.fire.call_count, 1)
+            args = event_batch_mock.fire.call_args[0]
+            self.assertEqual(args[1], 'product.product')
+            self.assertEqual(sorted(args[2]), sorted(self.products.ids))
+
+    def test_event_price_changed_products(self):
+        """ Test if the batch price event is fired once for the
+        products """
+        event_batch = ('openerp.addons.connector_ecommerce.models.'
+                       'product.on_product_price_changed_batch')
+        with mock.patch(event_batch) as event_batch_mock:
+            self.products.write({'standard_price': 5})
+            event_batch_mock.fire.assert_called_once_with(
+                mock.ANY, 'product.product', self.products.ids
+            )
+
+    def test_event_price_not_changed(self):
+        """ Test that no price event is fired when the prices are
+        written with the same values """
+        event = ('openerp.addons.connector_ecommerce.models.'
+                 'product.on_product_price_changed')
+        self.products.write({'standard_price': 5})
+        with mock.patch(event) as event_mock:
+            self.template.write({'list_price': 10})
+            self.products.write({'standard_price': 5})
+            self.assertFalse(event_mock.fire.called)
+            self.products.write({'standard_price': 6})
+            event_mock.fire.assert_has_calls(
+                [mock.call(mock.ANY, 'product.product', product.id)
+                 for product in self.products],
+                any_order=True,
+            )
+
+    def test_event_price_changed_some_products(self):
+        """ Test that the price event is fired only for the products
+        whose price changed """
+        event = ('openerp.addons.connector_ecommerce.models.'
+                 'product.on_product_price_changed')
+        self.product.standard_price = 5
+        with mock.patch(event) as event_mock:
+            self.products.write({'standard_price': 5})
+            event_mock.fire.assert_called_once_with(
+                mock.ANY, 'product.product', self.product2.id
+            )
+
+
+class TestProductCheckpoint(common.TransactionCase):
+    """ Test the field ``has_checkpoint`` of the products """
+
+    def setUp(self):
+        super(TestProductCheckpoint, self).setUp()
+        product_model = self.env['product.product']
+        self.product1 = product_model.create({'name': 'Product 1'})
+        self.product2 = product_model.create({'name': 'Product 2'})
+        self.product3 = product_model.create({'name': 'Product 3'})
+        model = self.env['ir.model'].search(
+            [('model', '=', 'product.product')]
+        )
+        checkpoint_model = self.env['connector.checkpoint']
+        for product in (self.product1, self.product2):
+            checkpoint_model.create({'model_id': model.id,
+                                     'record_id': product.id,
+                                     'backend_id': 'connector.backend,1',
+                                     })
+        self.product2_checkpoint = checkpoint_model.search(
+            [('model_id', '=', model.id),
+             ('record_id', '=', self.product2.id)]
+        )
+
+    def test_compute(self):
+        """ Compute has_checkpoint for many products """
+        self.product2_checkpoint.reviewed()
+        products = self.product1 | self.product2 | self.product3
+        self.assertEqual(products.mapped('has_checkpoint'),
+                         [True, False, False])
+
+    def test_search(self):
+        """ Search the products having a checkpoint """
+        product_model = self.env['product.product']
+        products = self.product1 | self.product2 | self.product3
+        domain = [('id', 'in', products.ids)]
+        self.assertEqual(
+            product_model.search(domain + [('has_checkpoint', '=', True)]),
+            self.product1 | self.product2
+        )
+        self.assertEqual(
+            product_model.search(domain + [('has_checkpoint', '=', False)]),
+            self.product3
+        )
+
+
+class TestProductPriceDelta(common.TransactionCase):
+    """ Test the price events fired only when the effective price moved """
+
+    def setUp(self):
+        super(TestProductPriceDelta, self).setUp()
+        self.template = self.env['product.template'].create({
+            'name': 'T-shirt',
+            'list_price': 10,
+        })
+        self.product = self.template.product_variant_ids
+        self.env['ir.config_parameter'].set_param(
+            'connector_ecommerce.price_delta', 'True')
+        self.price_model = self.env['connector.product.price']
+        self.pricelist = self.env.ref('product.list0')
+        patcher = mock.patch.object(type(self.price_model),
+                                    '_get_pricelists',
+                                    return_value=self.pricelist)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_price_moved(self):
+        """ The event is fired when the price on the pricelist moved """
+        event = ('openerp.addons.connector_ecommerce.models.'
+                 'product.on_product_price_changed')
+        with mock.patch(event) as event_mock:
+            self.template.list_price = 20
+            event_mock.fire.assert_called_once_with(
+                mock.ANY, 'product.product', self.product.id
+            )
+        stored = self.price_model.search(
+            [('product_id', '=', self.product.id)]
+        )
+        self.assertEqual(stored.pricelist_id, self.pricelist)
+        self.assertEqual(stored.price, 20)
+
+    def test_price_not_moved(self):
+        """ The event is not fired when the price on the pricelist is
+        the same """
+        self.price_model.store_prices({
+            (self.product.id, self.pricelist.id): 10,
+        })
+        event = ('openerp.addons.connector_ecommerce.models.'
+                 'product.on_product_price_changed')
+        with mock.patch(event) as event_mock:
+            # the public pricelist is based on the sale price
+            self.product.standard_price = 7
+            self.assertFalse(event_mock.fire.called)
+
+    def test_backend_pricelists_no_access(self):
+        """ The pricelists of the backends are read for any user """
+        user = self.env['res.users'].create({
+            'name': 'Price User',
+            'login': 'price_user',
+            'groups_id': [(6, 0, [])],
+        })
+        pricelist = self.env['product.pricelist'].create(
+            {'name': 'Backend Pricelist'}
+        )
+        # the sales orders stand for a backend model having a pricelist
+        # not readable by the user
+        self.env['sale.order'].create({
+            'partner_id': self.env['res.partner'].create(
+                {'name': 'Customer'}
+            ).id,
+            'pricelist_id': pricelist.id,
+        })
+        price_model = self.env['connector.product.price'].sudo(user)
+        price_model.clear_caches()
+        with mock.patch.object(type(price_model), '_get_backend_models',
+                               return_value=['sale.order']):
+            pricelist_ids = price_model._get_backend_pricelist_ids()
+        self.assertIn(pricelist.id, pricelist_ids)
+
+    def test_store_prices_concurrent(self):
+        """ A price inserted by another transaction is kept """
+        key = (self.product.id, self.pricelist.id)
+        price_model = type(self.price_model)
+        with mock.patch.object(price_model, '_get_stored_prices',
+                               return_value={}):
+            self.price_model.store_prices({key: 20})
+            # the price looks new again, as if another transaction
+            # inserted it
+            self.price_model.store_prices({key: 30})
+        stored = self.price_model.search(
+            [('product_id', '=', self.product.id)]
+        )
+        self.assertEqual(len(stored), 1)
+        self.assertEqual(stored.price, 20)
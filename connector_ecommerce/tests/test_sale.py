@@ -0,0 +1,202 @@
+# -*- coding: utf-8 -*-
+# © 2016 Camptocamp SA
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html)
+
+import mock
+
+from openerp import exceptions
+from openerp.addons.connector.exception import RetryableJobError
+import openerp.tests.common as common
+
+
+class TestSaleNeedCancel(common.TransactionCase):
+    """ Test the flags of the sales orders canceled on the backend """
+
+    def setUp(self):
+        super(TestSaleNeedCancel, self).setUp()
+        sale_model = self.env['sale.order']
+        partner = self.env['res.partner'].create({'name': 'Ygritte'})
+        self.orders = sale_model.browse()
+        for __ in range(3):
+            self.orders |= sale_model.create({'partner_id': partner.id})
+        self.canceled, self.resolved, self.normal = self.orders
+        # orders in 'done' cannot be automatically canceled
+        (self.canceled | self.resolved).write({'state': 'done'})
+        (self.canceled | self.resolved).write({'canceled_in_backend': True})
+        self.resolved.write({'cancellation_resolved': True})
+
+    def test_need_cancel_stored(self):
+        """ need_cancel is stored and searchable """
+        self.assertEqual(self.orders.mapped('need_cancel'),
+                         [True, False, False])
+        found = self.env['sale.order'].search(
+            [('id', 'in', self.orders.ids), ('need_cancel', '=', True)]
+        )
+        self.assertEqual(found, self.canceled)
+
+    def test_log_canceled_in_backend(self):
+        """ A message is posted on each order canceled on the backend """
+        for order in self.canceled | self.resolved:
+            messages = self.env['mail.message'].search(
+                [('model', '=', 'sale.order'),
+                 ('res_id', '=', order.id),
+                 ('body', 'ilike', 'has been canceled on the backend')]
+            )
+            self.assertEqual(len(messages), 1)
+            self.assertEqual(messages.author_id,
+                             self.env.user.partner_id)
+
+    def test_try_auto_cancel_isolated(self):
+        """ An order failing to be canceled does not prevent the
+        cancellation of the others """
+        sale_model = self.env['sale.order']
+        partner = self.env['res.partner'].create({'name': 'Jon'})
+        orders = sale_model.browse()
+        for __ in range(3):
+            orders |= sale_model.create({'partner_id': partner.id})
+        failing = orders[1]
+        action_cancel = type(sale_model).action_cancel
+
+        def fail_action_cancel(self):
+            if failing in self:
+                self.write({'note': 'partially canceled'})
+                raise exceptions.UserError('Cannot cancel')
+            return action_cancel(self)
+
+        with mock.patch.object(type(sale_model), 'action_cancel',
+                               fail_action_cancel):
+            outcomes = (orders | self.canceled)._try_auto_cancel()
+        self.assertEqual(outcomes, {orders[0].id: 'canceled',
+                                    failing.id: 'failed',
+                                    orders[2].id: 'canceled',
+                                    self.canceled.id: 'done'})
+        self.assertEqual(orders.mapped('state'),
+                         ['cancel', 'draft', 'cancel'])
+        # the partial work on the failing order has been rolled back
+        self.assertFalse(failing.note)
+
+    def test_try_auto_cancel_retryable(self):
+        """ The transient errors are not reported as failed cancellations
+        but raised, so the job is retried """
+        sale_model = self.env['sale.order']
+        order = sale_model.create({'partner_id': self.canceled.partner_id.id})
+
+        def locked_action_cancel(self):
+            raise RetryableJobError('Locked')
+
+        with mock.patch.object(type(sale_model), 'action_cancel',
+                               locked_action_cancel):
+            with self.assertRaises(RetryableJobError):
+                order._try_auto_cancel()
+
+    def test_ignore_cancel_wizard_chunks(self):
+        """ The wizard resolves the orders by chunks below the threshold """
+        self.env['ir.config_parameter'].set_param(
+            'connector_ecommerce.ignore_cancel_chunk_size', '1')
+        self.normal.write({'canceled_in_backend': True})
+        orders = self.canceled | self.normal
+        wizard = self.env['sale.ignore.cancel'].with_context(
+            active_ids=orders.ids,
+        ).create({'reason': 'Keep it'})
+        action = wizard.confirm_ignore_cancel()
+        self.assertEqual(action['type'], 'ir.actions.act_window_close')
+        self.assertTrue(all(orders.mapped('cancellation_resolved')))
+        for order in orders:
+            self.assertIn('Keep it', order.message_ids[0].body)
+
+    def test_ignore_cancel_wizard_jobs(self):
+        """ The wizard delays jobs above the threshold """
+        self.env['ir.config_parameter'].set_param(
+            'connector_ecommerce.ignore_cancel_job_threshold', '1')
+        orders = self.canceled | self.normal
+        wizard = self.env['sale.ignore.cancel'].with_context(
+            active_ids=orders.ids,
+        ).create({'reason': 'Keep it'})
+        target = ('openerp.addons.connector_ecommerce.wizard.'
+                  'sale_ignore_cancel.ignore_cancellation_sale_orders')
+        with mock.patch(target) as job_mock:
+            job_mock.delay.return_value = 'uuid-1'
+            action = wizard.confirm_ignore_cancel()
+        self.assertEqual(job_mock.delay.call_count, 1)
+        self.assertEqual(action['res_id'], wizard.id)
+        self.assertEqual(wizard.state, 'queued')
+        self.assertEqual(wizard.order_count, 2)
+        self.assertEqual(wizard.job_uuids, 'uuid-1')
+        self.assertFalse(self.canceled.cancellation_resolved)
+
+
+class TestSaleParentNeedCancel(common.TransactionCase):
+    """ Test the flag of the sales orders whose parents need cancel """
+
+    def setUp(self):
+        super(TestSaleParentNeedCancel, self).setUp()
+        self.sale_model = self.env['sale.order']
+        partner = self.env['res.partner'].create({'name': 'Tormund'})
+        self.orders = self.sale_model.browse()
+        for __ in range(5):
+            self.orders |= self.sale_model.create({'partner_id': partner.id})
+        # {order id: parent order id}, used by the patched compute of
+        # parent_id in place of the logic of a connector
+        self.parents = {}
+        parents = self.parents
+
+        def compute_parent_id(records):
+            for order in records:
+                order.parent_id = parents.get(order.id, False)
+
+        patcher = mock.patch.object(type(self.sale_model),
+                                    '_compute_parent_id',
+                                    compute_parent_id)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def set_parents(self, parents):
+        self.parents.update(parents)
+        self.sale_model.invalidate_cache()
+
+    def test_parent_canceled_after_child(self):
+        """ The child is updated when its parent is canceled later """
+        parent, child = self.orders[:2]
+        self.set_parents({child.id: parent.id})
+        self.assertFalse(child.parent_need_cancel)
+        parent.write({'state': 'done'})
+        parent.write({'canceled_in_backend': True})
+        self.assertTrue(parent.need_cancel)
+        self.assertTrue(child.parent_need_cancel)
+
+    def test_ancestors_chain(self):
+        """ The flag follows all the levels of parents """
+        grandparent, parent, child, other = self.orders[:4]
+        self.set_parents({parent.id: grandparent.id,
+                          child.id: parent.id})
+        grandparent.write({'state': 'done'})
+        grandparent.write({'canceled_in_backend': True})
+        self.assertEqual(
+            self.orders[:3]._get_ancestor_ids(),
+            {grandparent.id: [],
+             parent.id: [grandparent.id],
+             child.id: [parent.id, grandparent.id]},
+        )
+        self.assertEqual(
+            (grandparent | parent | child | other).mapped(
+                'parent_need_cancel'
+            ),
+            [False, True, True, False],
+        )
+
+    def test_ancestors_cycle(self):
+        """ A cycle in the parents stops the resolution """
+        first, second, third = self.orders[:3]
+        self.set_parents({first.id: second.id,
+                          second.id: third.id,
+                          third.id: first.id})
+        ancestors = (first | second)._get_ancestor_ids()
+        self.assertEqual(ancestors, {first.id: [second.id, third.id],
+                                     second.id: [third.id, first.id]})
+        self.assertFalse(first.parent_need_cancel)
+        third.write({'state': 'done'})
+        third.write({'canceled_in_backend': True})
+        self.assertTrue(first.parent_need_cancel)
+        self.assertTrue(second.parent_need_cancel)
+        # an order in a cycle is its own ancestor, it is not counted
+        self.assertFalse(third.parent_need_cancel)
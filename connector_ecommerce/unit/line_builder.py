@@ -22,6 +22,10 @@ class SpecialOrderLineBuilder(ConnectorUnit):
         builder.price_unit = 100
         builder.get_line()
 
+    Or for many sales orders at once::
+
+        builder.get_lines([{'price_unit': 100}, {'price_unit': 12}])
+
     """
     _model_name = None
 
@@ -35,23 +39,59 @@ class SpecialOrderLineBuilder(ConnectorUnit):
         self.sign = 1
         self.sequence = 980
 
-    def get_line(self):
-        assert self.product_ref or self.product
-        assert self.price_unit is not None
+    def _get_product_values(self):
+        """ Return the id, name and unit of measure of the product
 
+        When the product is given by ``product_ref``, the values are
+        read from a cache shared by all the imports.
+        """
         product = self.product
         if product is None:
-            product = self.env.ref('.'.join(self.product_ref))
+            product_model = self.env['product.product']
+            xmlid = '.'.join(self.product_ref)
+            return product_model._get_special_line_product(xmlid)
 
         if not isinstance(product, models.BaseModel):
             product = self.env['product.product'].browse(product)
-        return {'product_id': product.id,
+        return {'id': product.id,
                 'name': product.name,
-                'product_uom': product.uom_id.id,
+                'uom_id': product.uom_id.id,
+                }
+
+    def get_line(self):
+        assert self.product_ref or self.product
+        assert self.price_unit is not None
+
+        product = self._get_product_values()
+        return {'product_id': product['id'],
+                'name': product['name'],
+                'product_uom': product['uom_id'],
                 'product_uom_qty': self.quantity,
                 'price_unit': self.price_unit * self.sign,
                 'sequence': self.sequence}
 
+    def get_lines(self, lines_params):
+        """ Build the lines of many sales orders at once
+
+        :param lines_params: for each line, the attributes of the builder
+                             to use for the line, such as ``price_unit``
+                             or ``quantity``
+        :type lines_params: list of dict
+        :return: list of values of sales order lines, in the same order
+                 than ``lines_params``
+        """
+        lines = []
+        for params in lines_params:
+            original = {attr: getattr(self, attr) for attr in params}
+            for attr, value in params.iteritems():
+                setattr(self, attr, value)
+            try:
+                lines.append(self.get_line())
+            finally:
+                for attr, value in original.iteritems():
+                    setattr(self, attr, value)
+        return lines
+
 
 class ShippingLineBuilder(SpecialOrderLineBuilder):
     """ Return values for a Shipping line """
@@ -3,11 +3,73 @@
 # © 2016 Camptocamp SA
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html)
 
+import copy
+from collections import defaultdict
+
+from openerp.tools.lru import LRU
 from openerp.addons.connector.connector import ConnectorUnit
 
 
+def _freeze(value):
+    """ Return a hashable version of a value of a ``write()`` dict """
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(item) for item in value)
+    if isinstance(value, dict):
+        return tuple(sorted((key, _freeze(item))
+                            for key, item in value.iteritems()))
+    return value
+
+
 class OnChangeManager(ConnectorUnit):
 
+    # keep the onchange specs and the blank values of the models in
+    # the registry's cache, see ``_get_onchange_template()``
+    use_onchange_cache = True
+
+    # Sparse mode: the onchanges receive only the fields of the form
+    # view (the ones of the onchange specs) and the given values,
+    # instead of all the fields of the model, as the web client does.
+    sparse_onchange = False
+
+    def _build_onchange_template(self, model, sparse):
+        onchange_specs = model._onchange_spec()
+        if sparse:
+            fields = [name for name in onchange_specs
+                      if '.' not in name and name in model._fields]
+        else:
+            fields = model._fields
+        return onchange_specs, dict.fromkeys(fields, False)
+
+    def _get_onchange_template(self, model, sparse=False):
+        """ Return the onchange specs of a model and a dict with all its
+        fields set to False
+
+        Both are expensive to build on models with many fields, so they
+        are kept in the registry's cache. The cache is dropped when the
+        registry is reloaded and when the caches are cleared (which
+        happens when a view is modified). The specs depend on the groups
+        of the user, so the key contains the uid.
+
+        The returned values are shared between the calls: they must be
+        copied before being modified.
+
+        :param model: model (empty recordset)
+        :param sparse: the blank values contain only the fields used
+                       in the onchange specs
+        :return: tuple (onchange specs, blank values)
+        """
+        if not self.use_onchange_cache:
+            return self._build_onchange_template(model, sparse)
+        cache = self.env.registry.cache
+        key = (model._name, 'connector_ecommerce.onchange_template',
+               self.env.uid, sparse)
+        try:
+            return cache[key]
+        except KeyError:
+            template = self._build_onchange_template(model, sparse)
+            cache[key] = template
+            return template
+
     def get_new_values(self, record, on_change_result, model=None):
         vals = on_change_result.get('value', {})
         new_values = {}
@@ -22,14 +84,16 @@ class OnChangeManager(ConnectorUnit):
 
     def play_onchanges(self, model, values, onchange_fields):
         model = self.env[model]
-        onchange_specs = model._onchange_spec()
+        onchange_specs, blank_values = self._get_onchange_template(
+            model, sparse=self.sparse_onchange
+        )
 
         # we need all fields in the dict even the empty ones
         # otherwise 'onchange()' will not apply changes to them
-        all_values = values.copy()
-        for field in model._fields:
-            if field not in all_values:
-                all_values[field] = False
+        all_values = blank_values.copy()
+        all_values.update(values)
+        for field in onchange_fields:
+            all_values.setdefault(field, False)
 
         # we work on a temporary record
         new_record = model.new(all_values)
@@ -61,6 +125,103 @@ class SaleOrderOnChange(OnChangeManager):
         'product_id',
     ]
 
+    # Number of results of the onchanges of the lines kept in memory.
+    # When > 0, the lines having the same values (all of them, the
+    # onchanges also compute fields such as the totals from the given
+    # prices, discounts and taxes) on sales orders sharing the same
+    # values for the keys below get the result of the first one.
+    # The cache lives as long as the ConnectorUnit (an import).
+    line_onchange_cache_size = 0
+
+    # values of the sales order on which the onchanges of the lines depend
+    line_onchange_cache_order_keys = [
+        'partner_id',
+        'pricelist_id',
+        'fiscal_position_id',
+        'company_id',
+    ]
+
+    # fields read by the onchanges, loaded at once for all the records
+    # of a batch in ``play_many()``
+    prefetch_fields = {
+        'res.partner': ['type',
+                        'child_ids.type',
+                        'property_product_pricelist',
+                        'property_payment_term_id',
+                        'property_account_position_id',
+                        'user_id',
+                        ],
+        'product.product': ['name',
+                            'uom_id.factor',
+                            'taxes_id.amount',
+                            ],
+        'product.uom': ['factor'],
+        'account.tax': ['amount'],
+        'account.payment.mode': ['workflow_process_id'],
+        'sale.workflow.process': ['picking_policy'],
+    }
+
+    def __init__(self, connector_env):
+        super(SaleOrderOnChange, self).__init__(connector_env)
+        self._line_onchange_cache = None
+
+    def clear_line_onchange_cache(self):
+        """ Forget the memoized results of the onchanges of the lines """
+        if self._line_onchange_cache is not None:
+            self._line_onchange_cache.clear()
+
+    def _line_onchange_cache_key(self, order, line):
+        """ Return the key of the memoized onchanges for a line
+
+        Returns None when the line cannot be memoized.
+        """
+        key = (_freeze(line),
+               tuple(_freeze(order.get(field))
+                     for field in self.line_onchange_cache_order_keys))
+        try:
+            hash(key)
+        except TypeError:
+            return None
+        return key
+
+    def _play_line_onchanges(self, order, line):
+        """ Play the onchanges on the values of a sales order line
+
+        When ``line_onchange_cache_size`` is set, the values added by the
+        onchanges are memoized.
+
+        :param order: values of the sales order (onchanges played)
+        :param line: values of the sales order line
+        :return: the values of the line updated by the onchanges
+        """
+        if not self.line_onchange_cache_size:
+            return self.play_onchanges('sale.order.line', line,
+                                       self.line_onchange_fields)
+
+        key = self._line_onchange_cache_key(order, line)
+        if key is None:
+            return self.play_onchanges('sale.order.line', line,
+                                       self.line_onchange_fields)
+
+        if self._line_onchange_cache is None:
+            self._line_onchange_cache = LRU(self.line_onchange_cache_size)
+        cache = self._line_onchange_cache
+        try:
+            added_values = cache[key]
+        except KeyError:
+            new_line = self.play_onchanges('sale.order.line', line,
+                                           self.line_onchange_fields)
+            # the onchanges never modify the values of the line, only
+            # add new ones, so only the latter are memoized
+            cache[key] = copy.deepcopy(
+                {field: value for field, value in new_line.iteritems()
+                 if field not in line}
+            )
+            return new_line
+        new_line = line.copy()
+        new_line.update(copy.deepcopy(added_values))
+        return new_line
+
     def play(self, order, order_lines):
         """ Play the onchange of the sales order and it's lines
 
@@ -92,10 +253,9 @@ class SaleOrderOnChange(OnChangeManager):
                 if command_line[0] in (0, 1):  # create or update values
                     # keeps command number and ID (or 0)
                     old_line_data = command_line[2]
-                    new_line_data = self.play_onchanges(
-                        'sale.order.line',
+                    new_line_data = self._play_line_onchanges(
+                        order,
                         old_line_data,
-                        self.line_onchange_fields
                     )
                     new_line = (command_line[0],
                                 command_line[1],
@@ -104,3 +264,66 @@ class SaleOrderOnChange(OnChangeManager):
                     # in place modification of the sales order line in the list
                     line_list[idx] = new_line
         return order
+
+    def _collect_relational_ids(self, model_name, values, ids_by_model):
+        """ Add the ids of the records referenced by the values to
+        ``ids_by_model`` ({model name: set of ids})
+        """
+        model_fields = self.env[model_name]._fields
+        for fieldname, value in values.iteritems():
+            field = model_fields.get(fieldname)
+            if field is None or not value:
+                continue
+            if field.type == 'many2one':
+                if isinstance(value, (int, long)):
+                    ids_by_model[field.comodel_name].add(value)
+            elif field.type == 'many2many':
+                ids = ids_by_model[field.comodel_name]
+                for command in value:
+                    if command[0] == 6:
+                        ids.update(command[2])
+                    elif command[0] == 4:
+                        ids.add(command[1])
+
+    def _prefetch_records(self, ids_by_model):
+        """ Load in the cache the ``prefetch_fields`` of the records """
+        for model_name, ids in ids_by_model.iteritems():
+            fieldnames = self.prefetch_fields.get(model_name)
+            if not ids or not fieldnames:
+                continue
+            model = self.env[model_name]
+            records = model.browse(list(ids))
+            for fieldname in fieldnames:
+                if fieldname.split('.')[0] in model._fields:
+                    # reading the field on the first record reads it
+                    # for all the records of the batch
+                    records.mapped(fieldname)
+
+    def play_many(self, orders):
+        """ Play the onchanges of many sales orders and their lines
+
+        The records referenced by the sales orders and lines (partners,
+        products, units of measure, taxes, payment modes, ...) are read
+        in a few queries for the whole batch before the onchanges are
+        played.
+
+        :param orders: sales orders as expected by :meth:`play`
+        :type: list of tuples (order values, order lines)
+
+        :return: the sales orders updated by the onchanges, in the same
+                 order than ``orders``
+        :rtype: list of dict
+        """
+        ids_by_model = defaultdict(set)
+        for order, order_lines in orders:
+            self._collect_relational_ids('sale.order', order, ids_by_model)
+            line_lists = [order_lines, order.get('order_line') or []]
+            for line_list in line_lists:
+                for command_line in line_list:
+                    if command_line[0] in (0, 1):
+                        self._collect_relational_ids('sale.order.line',
+                                                     command_line[2],
+                                                     ids_by_model)
+        self._prefetch_records(ids_by_model)
+        return [self.play(order, order_lines)
+                for order, order_lines in orders]
@@ -3,6 +3,8 @@
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html)
 
 from openerp import models, fields, api
+from openerp.addons.connector.session import ConnectorSession
+from ..models.sale import ignore_cancellation_sale_orders
 
 
 class SaleIgnoreCancel(models.TransientModel):
@@ -10,6 +12,31 @@ class SaleIgnoreCancel(models.TransientModel):
     _description = 'Ignore Sales Order Cancel'
 
     reason = fields.Html(required=True)
+    state = fields.Selection(selection=[('draft', 'Draft'),
+                                        ('queued', 'Queued')],
+                             default='draft',
+                             readonly=True)
+    order_count = fields.Integer(string='Sales Orders', readonly=True)
+    job_uuids = fields.Text(readonly=True)
+
+    @api.model
+    def _get_param(self, key, default):
+        params = self.env['ir.config_parameter'].sudo()
+        return int(params.get_param(key, default=default))
+
+    @api.model
+    def _chunk_size(self):
+        """ Number of sales orders processed together """
+        return self._get_param('connector_ecommerce.ignore_cancel_chunk_size',
+                               100)
+
+    @api.model
+    def _job_threshold(self):
+        """ Above this number of sales orders, they are processed in
+        background jobs """
+        return self._get_param(
+            'connector_ecommerce.ignore_cancel_job_threshold', 500
+        )
 
     @api.multi
     def confirm_ignore_cancel(self):
@@ -17,5 +44,40 @@ class SaleIgnoreCancel(models.TransientModel):
         sale_ids = self.env.context.get('active_ids')
         assert sale_ids
         sales = self.env['sale.order'].browse(sale_ids)
-        sales.ignore_cancellation(self.reason)
-        return {'type': 'ir.actions.act_window_close'}
+        chunk_size = self._chunk_size()
+        chunks = [sales[index:index + chunk_size]
+                  for index in xrange(0, len(sales), chunk_size)]
+        if len(sales) <= self._job_threshold():
+            for chunk in chunks:
+                chunk.ignore_cancellation(self.reason)
+            return {'type': 'ir.actions.act_window_close'}
+
+        session = ConnectorSession.from_env(self.env)
+        uuids = []
+        for chunk in chunks:
+            uuid = ignore_cancellation_sale_orders.delay(
+                session, 'sale.order', chunk.ids, self.reason,
+                description='Ignore the cancellation of %d sales orders' %
+                            len(chunk),
+            )
+            uuids.append(uuid)
+        self.write({'state': 'queued',
+                    'order_count': len(sales),
+                    'job_uuids': '\n'.join(uuids),
+                    })
+        return {'type': 'ir.actions.act_window',
+                'res_model': self._name,
+                'res_id': self.id,
+                'view_mode': 'form',
+                'target': 'new',
+                }
+
+    @api.multi
+    def action_view_jobs(self):
+        """ Display the jobs processing the sales orders, to follow
+        their progress """
+        self.ensure_one()
+        action = self.env.ref('connector.action_queue_job').read()[0]
+        action['domain'] = [('uuid', 'in', self.job_uuids.split('\n'))]
+        action['context'] = {}
+        return action